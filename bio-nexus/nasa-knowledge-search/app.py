@@ -418,9 +418,8 @@ def main():
         
         # Check database connection
         try:
-            docs = st.session_state.db_manager.get_all_documents()
+            doc_count = st.session_state.db_manager.count_documents()
             db_status = "🟢 Connected"
-            doc_count = len(docs)
         except Exception as e:
             db_status = "🔴 Disconnected"
             doc_count = 0
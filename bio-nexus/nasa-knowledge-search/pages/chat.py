@@ -244,6 +244,7 @@ def process_user_query(query: str, search_type: str, rag_system, db_manager):
                 follow_ups = response.get('follow_up_questions', [])
                 confidence = response.get('confidence', 0.0)
                 query_type = response.get('query_type', 'unknown')
+                related_topics = response.get('related_topics', [])
                 
                 progress_container.empty()
                 
@@ -268,6 +269,11 @@ def process_user_query(query: str, search_type: str, rag_system, db_manager):
                             st.session_state.user_input = follow_up
                             st.rerun()
                 
+                # Display knowledge graph topics found alongside the answer
+                if related_topics:
+                    st.markdown("#### 🔗 Related Topics")
+                    st.caption(" · ".join(related_topics))
+                
                 # Create assistant message
                 assistant_message = {
                     'message_type': 'assistant',
@@ -277,7 +283,8 @@ def process_user_query(query: str, search_type: str, rag_system, db_manager):
                     'metadata': {
                         'confidence': confidence,
                         'query_type': query_type,
-                        'follow_ups': follow_ups
+                        'follow_ups': follow_ups,
+                        'related_topics': related_topics
                     }
                 }
                 
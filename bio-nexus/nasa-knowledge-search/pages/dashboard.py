@@ -89,11 +89,11 @@ def show_dashboard():
     with col1:
         # PostgreSQL Status
         try:
-            documents = db_manager.get_all_documents()
+            document_count = db_manager.count_documents()
             st.markdown(f"""
             <div class="status-success">
                 <strong>✅ PostgreSQL Connected</strong><br>
-                Database operational with {len(documents)} documents indexed
+                Database operational with {document_count} documents indexed
             </div>
             """, unsafe_allow_html=True)
         except Exception as e:
@@ -324,7 +324,7 @@ def show_dashboard():
     with col1:
         # Database health
         try:
-            test_docs = db_manager.get_all_documents()
+            db_manager.count_documents()
             db_health = "🟢 Healthy"
             db_latency = "< 100ms"
         except Exception as e:
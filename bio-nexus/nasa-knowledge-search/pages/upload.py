@@ -3,15 +3,38 @@ import os
 import tempfile
 import logging
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import asyncio
 import time
 import json
-import uuid
 from src.document_processor import get_document_processor
 
 logger = logging.getLogger(__name__)
 
+# Minimum seconds between progress widget updates during batch processing
+PROGRESS_UPDATE_INTERVAL = 0.25
+
+def serialize_chunk_metadata(chunks: List[Dict]) -> List[str]:
+    """Serialize chunk metadata in one pass, leaving out the content already stored in its own column"""
+    return [json.dumps({k: v for k, v in chunk.items() if k != 'content'}) for chunk in chunks]
+
+def embed_chunks(doc_processor, chunks: List[Dict]) -> List[Any]:
+    """Embed all chunk contents in one batch, one entry (or None) per chunk"""
+    if not chunks:
+        return []
+    embeddings = doc_processor.generate_embeddings([chunk['content'] for chunk in chunks]) or []
+    return embeddings + [None] * (len(chunks) - len(embeddings))
+
+def format_embedding(embedding: Any) -> Optional[str]:
+    """Format an embedding as a PostgreSQL vector literal, or None if it is empty or invalid"""
+    if not embedding or not isinstance(embedding, list):
+        return None
+    try:
+        return f"[{','.join(map(str, embedding))}]"
+    except Exception as e:
+        logger.error(f"Error formatting embedding vector: {e}")
+        return None
+
 def show_upload_page():
     """Display the document upload page with bulk upload capabilities"""
     
@@ -333,8 +356,7 @@ def show_existing_files_processing(db_manager, doc_processor):
     
     # Check which files are already processed
     try:
-        existing_docs = db_manager.get_all_documents()
-        existing_filenames = {doc['filename'] for doc in existing_docs}
+        existing_filenames = {doc['filename'] for doc in db_manager.get_all_documents(stream=True)}
         
         unprocessed_files = [f for f in pdf_files if f.name not in existing_filenames]
         processed_files = [f for f in pdf_files if f.name in existing_filenames]
@@ -435,89 +457,78 @@ def process_single_document(uploaded_file, db_manager, doc_processor,
             return
         
         progress_bar.progress(30)
-        status_text.text("📝 Generating summary...")
-        
-        # Generate summary if requested
-        summary = ""
-        if generate_summary:
-            summary = doc_processor.summarize_document(processed_data['content'])
+        status_text.text("📝 Generating summary, embeddings and entities...")
+        
+        # Summary, document embedding and entity extraction run concurrently
+        analysis = doc_processor.analyze_document(
+            processed_data['content'],
+            summarize=generate_summary,
+            embed=create_embeddings,
+            extract_entities=extract_entities
+        )
+        summary = analysis['summary']
         
         progress_bar.progress(50)
-        status_text.text("🔤 Creating embeddings...")
         
-        # Generate embeddings if requested
+        # Format embedding if requested
         embedding = None
         if create_embeddings:
-            embedding_result = doc_processor.generate_embeddings(processed_data['content'])
-            if embedding_result and isinstance(embedding_result, list) and len(embedding_result) > 0:
-                # Format embedding as a proper vector string for PostgreSQL
-                try:
-                    embedding = f"[{','.join(map(str, embedding_result))}]"
-                    logger.info(f"Generated embedding vector with {len(embedding_result)} dimensions")
-                except Exception as e:
-                    logger.error(f"Error formatting embedding vector: {e}")
-                    embedding = None
+            embedding = format_embedding(analysis['embedding'])
+            if embedding:
+                logger.info(f"Generated embedding vector with {len(analysis['embedding'])} dimensions")
             else:
                 logger.warning("No valid embedding generated for document")
-                embedding = None
         
         progress_bar.progress(70)
-        status_text.text("💾 Saving to database...")
-        
-        # Prepare document data for database
-        document_data = {
-            'filename': uploaded_file.name,
-            'title': processed_data['title'],
-            'content': processed_data['content'],
-            'summary': summary,
-            'file_type': uploaded_file.type,
-            'file_size': uploaded_file.size,
-            'metadata': json.dumps(processed_data.get('metadata', {})),
-            'embedding': embedding
-        }
-        
-        # Insert document
-        document_id = db_manager.insert_document(document_data)
-        
-        progress_bar.progress(80)
         status_text.text("🧩 Processing chunks...")
         
         # Process chunks if requested
+        chunk_rows = []
         if chunk_document:
             chunks = doc_processor.chunk_document(processed_data['content'])
+            chunk_metadata = serialize_chunk_metadata(chunks)
+            chunk_embeddings = embed_chunks(doc_processor, chunks) if create_embeddings else []
             
             for i, chunk in enumerate(chunks):
                 chunk_embedding = None
                 if create_embeddings:
-                    embedding_result = doc_processor.generate_embeddings(chunk['content'])
-                    if embedding_result and isinstance(embedding_result, list) and len(embedding_result) > 0:
-                        # Format embedding as a proper vector string for PostgreSQL
-                        try:
-                            chunk_embedding = f"[{','.join(map(str, embedding_result))}]"
-                        except Exception as e:
-                            logger.error(f"Error formatting chunk embedding: {e}")
-                            chunk_embedding = None
-                    else:
-                        chunk_embedding = None
+                    chunk_embedding = format_embedding(chunk_embeddings[i])
                 
                 chunk_data = {
-                    'document_id': document_id,
                     'chunk_index': i,
                     'content': chunk['content'],
                     'chunk_type': chunk.get('chunk_type', 'text'),
                     'page_number': chunk.get('page_number'),
                     'embedding': chunk_embedding,
-                    'metadata': json.dumps(chunk)
+                    'metadata': chunk_metadata[i]
                 }
                 
-                db_manager.insert_document_chunk(chunk_data)
+                chunk_rows.append(chunk_data)
+        
+        progress_bar.progress(80)
+        status_text.text("💾 Saving to database...")
+        
+        # Prepare document data for database
+        document_data = {
+            'filename': uploaded_file.name,
+            'title': processed_data['title'],
+            'content': processed_data['content'],
+            'summary': summary,
+            'file_type': uploaded_file.type,
+            'file_size': uploaded_file.size,
+            'metadata': json.dumps(processed_data.get('metadata', {})),
+            'embedding': embedding
+        }
+        
+        # Insert document and chunks in one transaction
+        document_id = db_manager.ingest_document(document_data, chunk_rows)
         
         progress_bar.progress(90)
         status_text.text("🕸️ Extracting entities...")
         
         # Extract entities and build knowledge graph if requested
         if extract_entities:
-            entities = doc_processor.extract_entities(processed_data['content'])
+            entities = analysis['entities']
             
             # Add entities to knowledge graph
             from src.neo4j_manager import get_neo4j_manager
@@ -534,12 +545,20 @@ def process_single_document(uploaded_file, db_manager, doc_processor,
                     'summary': summary
                 })
                 
+                # Embed all entity descriptions in one batch
+                entity_embeddings = []
+                if create_embeddings and entities:
+                    entity_embeddings = doc_processor.generate_embeddings(
+                        [entity['description'] for entity in entities]
+                    ) or []
+                    entity_embeddings += [None] * (len(entities) - len(entity_embeddings))
+                
                 # Process entities
-                for entity in entities:
-                    entity_id = str(uuid.uuid4())
-                    entity_embedding = []
+                neo4j_entities = []
+                for i, entity in enumerate(entities):
+                    entity_embedding = None
                     if create_embeddings:
-                        entity_embedding = doc_processor.generate_embeddings(entity['description'])
+                        entity_embedding = format_embedding(entity_embeddings[i])
                     
                     # Add to PostgreSQL
                     entity_data = {
@@ -553,21 +572,23 @@ def process_single_document(uploaded_file, db_manager, doc_processor,
                     try:
                         pg_entity_id = db_manager.insert_kg_entity(entity_data)
                         
-                        # Add to Neo4j
-                        neo4j_entity_data = {
+                        # Collect for one bulk Neo4j write
+                        neo4j_entities.append({
                             'id': pg_entity_id,
                             'name': entity['name'],
                             'entity_type': entity['type'],
                             'description': entity['description']
-                        }
-                        
-                        neo4j_manager.create_entity_node(neo4j_entity_data)
-                        
-                        # Create relationship between document and entity
-                        neo4j_manager.create_document_entity_relationship(document_id, pg_entity_id)
+                        })
                         
                     except Exception as e:
                         logger.error(f"Error adding entity to knowledge graph: {e}")
+                
+                # Create entity nodes and document links in one session
+                with neo4j_manager.session_scope() as session:
+                    neo4j_manager.create_entities_bulk(neo4j_entities, session=session)
+                    neo4j_manager.create_document_entity_relationships_bulk(
+                        document_id, [entity['id'] for entity in neo4j_entities], session=session
+                    )
         
         progress_bar.progress(100)
         status_text.text("✅ Processing complete!")
@@ -644,24 +665,19 @@ def process_bulk_documents(uploaded_files, db_manager, doc_processor,
             processed_data = doc_processor.process_file(tmp_file_path, uploaded_file.name)
             
             if processed_data['content']:
-                # Generate summary
-                summary = ""
-                if generate_summary:
-                    summary = doc_processor.summarize_document(processed_data['content'])
+                # Summary, document embedding and entity extraction run concurrently
+                analysis = doc_processor.analyze_document(
+                    processed_data['content'],
+                    summarize=generate_summary,
+                    embed=create_embeddings,
+                    extract_entities=extract_entities
+                )
+                summary = analysis['summary']
                 
-                # Generate embeddings
+                # Format embedding
                 embedding = None
                 if create_embeddings:
-                    embedding_result = doc_processor.generate_embeddings(processed_data['content'])
-                    if embedding_result and isinstance(embedding_result, list) and len(embedding_result) > 0:
-                        # Format embedding as a proper vector string for PostgreSQL
-                        try:
-                            embedding = f"[{','.join(map(str, embedding_result))}]"
-                        except Exception as e:
-                            logger.error(f"Error formatting bulk embedding: {e}")
-                            embedding = None
-                    else:
-                        embedding = None
+                    embedding = format_embedding(analysis['embedding'])
                 
                 # Save to database
                 document_data = {
@@ -675,36 +691,38 @@ def process_bulk_documents(uploaded_files, db_manager, doc_processor,
                     'embedding': embedding
                 }
                 
-                document_id = db_manager.insert_document(document_data)
-                
                 # Process chunks
                 chunks_created = 0
+                chunk_rows = []
                 if chunk_document:
                     chunks = doc_processor.chunk_document(processed_data['content'])
                     chunks_created = len(chunks)
+                    chunk_metadata = serialize_chunk_metadata(chunks)
+                    chunk_embeddings = embed_chunks(doc_processor, chunks) if create_embeddings else []
                     
                     for chunk_idx, chunk in enumerate(chunks):
-                        chunk_embedding = []
+                        chunk_embedding = None
                         if create_embeddings:
-                            chunk_embedding = doc_processor.generate_embeddings(chunk['content'])
+                            chunk_embedding = format_embedding(chunk_embeddings[chunk_idx])
                         
                         chunk_data = {
-                            'document_id': document_id,
                             'chunk_index': chunk_idx,
                             'content': chunk['content'],
                             'chunk_type': chunk.get('chunk_type', 'text'),
                             'page_number': chunk.get('page_number'),
                             'embedding': chunk_embedding,
-                            'metadata': json.dumps(chunk)
+                            'metadata': chunk_metadata[chunk_idx]
                         }
                         
-                        db_manager.insert_document_chunk(chunk_data)
+                        chunk_rows.append(chunk_data)
+                
+                # Insert document and chunks in one transaction
+                db_manager.ingest_document(document_data, chunk_rows)
                 
                 # Extract entities (simplified for bulk processing)
                 entities_created = 0
                 if extract_entities:
-                    entities = doc_processor.extract_entities(processed_data['content'])
-                    entities_created = len(entities)
+                    entities_created = len(analysis['entities'])
                     # Note: Simplified entity processing for bulk upload
                 
                 results['successful'].append({
@@ -781,31 +799,34 @@ def process_existing_files(selected_files, db_manager, doc_processor,
     }
     
     total_files = len(selected_files)
+    last_update = 0.0
     
     for i, file_path in enumerate(selected_files):
-        current_file_text.text(f"Processing {i+1}/{total_files}: {file_path.name}")
+        # Throttle widget updates; each one is a round-trip to the browser
+        now = time.monotonic()
+        if now - last_update >= PROGRESS_UPDATE_INTERVAL or i == total_files - 1:
+            current_file_text.text(f"Processing {i+1}/{total_files}: {file_path.name}")
+            overall_progress.progress(i / total_files)
+            last_update = now
         
         try:
             # Process document
             processed_data = doc_processor.process_file(str(file_path), file_path.name)
             
             if processed_data['content']:
-                # Generate summary
-                summary = ""
-                if generate_summary:
-                    summary = doc_processor.summarize_document(processed_data['content'])
+                # Summary, document embedding and entity extraction run concurrently
+                analysis = doc_processor.analyze_document(
+                    processed_data['content'],
+                    summarize=generate_summary,
+                    embed=create_embeddings,
+                    extract_entities=extract_entities
+                )
+                summary = analysis['summary']
                 
-                # Generate embeddings
+                # Format embedding
                 embedding = None
                 if create_embeddings:
-                    embedding_result = doc_processor.generate_embeddings(processed_data['content'])
-                    if embedding_result and isinstance(embedding_result, list) and len(embedding_result) > 0:
-                        # Format embedding as a proper vector string for PostgreSQL
-                        try:
-                            embedding = f"[{','.join(map(str, embedding_result))}]"
-                        except Exception as e:
-                            logger.error(f"Error formatting existing file embedding: {e}")
-                            embedding = None
+                    embedding = format_embedding(analysis['embedding'])
                 
                 # Save to database
                 document_data = {
@@ -819,36 +840,38 @@ def process_existing_files(selected_files, db_manager, doc_processor,
                     'embedding': embedding
                 }
                 
-                document_id = db_manager.insert_document(document_data)
-                
                 # Process chunks
                 chunks_created = 0
+                chunk_rows = []
                 if chunk_document:
                     chunks = doc_processor.chunk_document(processed_data['content'])
                     chunks_created = len(chunks)
+                    chunk_metadata = serialize_chunk_metadata(chunks)
+                    chunk_embeddings = embed_chunks(doc_processor, chunks) if create_embeddings else []
                     
                     for chunk_idx, chunk in enumerate(chunks):
-                        chunk_embedding = []
+                        chunk_embedding = None
                         if create_embeddings:
-                            chunk_embedding = doc_processor.generate_embeddings(chunk['content'])
+                            chunk_embedding = format_embedding(chunk_embeddings[chunk_idx])
                         
                         chunk_data = {
-                            'document_id': document_id,
                             'chunk_index': chunk_idx,
                             'content': chunk['content'],
                             'chunk_type': chunk.get('chunk_type', 'text'),
                             'page_number': chunk.get('page_number'),
                             'embedding': chunk_embedding,
-                            'metadata': json.dumps(chunk)
+                            'metadata': chunk_metadata[chunk_idx]
                         }
                         
-                        db_manager.insert_document_chunk(chunk_data)
+                        chunk_rows.append(chunk_data)
+                
+                # Insert document and chunks in one transaction
+                db_manager.ingest_document(document_data, chunk_rows, use_copy=True)
                 
                 # Extract entities
                 entities_created = 0
                 if extract_entities:
-                    entities = doc_processor.extract_entities(processed_data['content'])
-                    entities_created = len(entities)
+                    entities_created = len(analysis['entities'])
                     # Simplified entity processing for bulk upload
                 
                 results['successful'].append({
@@ -872,9 +895,8 @@ def process_existing_files(selected_files, db_manager, doc_processor,
                 'error': str(e)
             })
             logger.error(f"Error processing {file_path.name}: {e}")
-        
-        # Update progress
-        overall_progress.progress((i + 1) / total_files)
+    
+    overall_progress.progress(1.0)
     
     # Display results
     current_file_text.text("✅ Processing complete!")
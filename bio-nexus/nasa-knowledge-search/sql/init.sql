@@ -13,7 +13,7 @@ CREATE TABLE IF NOT EXISTS documents (
     upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     processed_date TIMESTAMP,
     metadata JSONB,
-    embedding vector(384)
+    embedding halfvec(768)
 );
 
 -- Create chunks table for document segments
@@ -24,7 +24,7 @@ CREATE TABLE IF NOT EXISTS document_chunks (
     content TEXT NOT NULL,
     chunk_type VARCHAR(50), -- paragraph, table, image_caption, etc.
     page_number INTEGER,
-    embedding vector(384),
+    embedding halfvec(768),
     metadata JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -35,6 +35,8 @@ CREATE TABLE IF NOT EXISTS chat_sessions (
     session_name VARCHAR(200),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    message_count INT DEFAULT 0,
+    last_message_time TIMESTAMP,
     metadata JSONB
 );
 
@@ -56,7 +58,7 @@ CREATE TABLE IF NOT EXISTS kg_entities (
     entity_type VARCHAR(100),
     description TEXT,
     properties JSONB,
-    embedding vector(384),
+    embedding halfvec(768),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -71,12 +73,21 @@ CREATE TABLE IF NOT EXISTS kg_relationships (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Create embedding cache keyed by a hash of model + content
+CREATE TABLE IF NOT EXISTS embedding_cache (
+    sha BYTEA PRIMARY KEY,
+    embedding vector(768),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for performance
-CREATE INDEX IF NOT EXISTS idx_documents_embedding ON documents USING ivfflat (embedding vector_cosine_ops);
-CREATE INDEX IF NOT EXISTS idx_chunks_embedding ON document_chunks USING ivfflat (embedding vector_cosine_ops);
-CREATE INDEX IF NOT EXISTS idx_entities_embedding ON kg_entities USING ivfflat (embedding vector_cosine_ops);
+-- Embeddings are L2-normalized, so document/chunk/entity search uses inner product (<#>)
+CREATE INDEX IF NOT EXISTS documents_embedding_hnsw ON documents USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS document_chunks_embedding_hnsw ON document_chunks USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS kg_entities_embedding_hnsw ON kg_entities USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64);
 CREATE INDEX IF NOT EXISTS idx_documents_filename ON documents(filename);
 CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON document_chunks(document_id);
 CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id);
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_last_updated ON chat_sessions(last_updated DESC);
 CREATE INDEX IF NOT EXISTS idx_kg_relationships_source ON kg_relationships(source_entity_id);
 CREATE INDEX IF NOT EXISTS idx_kg_relationships_target ON kg_relationships(target_entity_id);
\ No newline at end of file
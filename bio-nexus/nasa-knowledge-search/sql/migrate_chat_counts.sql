@@ -0,0 +1,18 @@
+-- Add denormalized message counters to chat_sessions.
+-- init.sql already creates these columns; run this once on databases created before that.
+
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS message_count INT DEFAULT 0;
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS last_message_time TIMESTAMP;
+
+-- Backfill from existing history
+UPDATE chat_sessions cs
+SET message_count = m.message_count,
+    last_message_time = m.last_message_time
+FROM (
+    SELECT session_id, COUNT(*) AS message_count, MAX(timestamp) AS last_message_time
+    FROM chat_messages
+    GROUP BY session_id
+) m
+WHERE cs.id = m.session_id;
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_last_updated ON chat_sessions(last_updated DESC);
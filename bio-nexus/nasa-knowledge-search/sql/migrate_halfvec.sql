@@ -0,0 +1,25 @@
+-- Migrate document, chunk and entity embeddings to FP16 halfvec(768) storage.
+-- init.sql already creates these columns as halfvec(768); run this once on databases created before that.
+-- Older databases stored 384-dim vectors, which cannot be cast to 768 dimensions, so existing
+-- embeddings are cleared; reprocess documents afterwards to regenerate them with Gemini.
+-- Runs in one transaction so a failure leaves the old columns and indexes untouched.
+
+BEGIN;
+
+-- Indexes built with vector_* operator classes cannot survive the type change
+DROP INDEX IF EXISTS idx_documents_embedding;
+DROP INDEX IF EXISTS idx_chunks_embedding;
+DROP INDEX IF EXISTS idx_entities_embedding;
+DROP INDEX IF EXISTS documents_embedding_hnsw;
+DROP INDEX IF EXISTS document_chunks_embedding_hnsw;
+DROP INDEX IF EXISTS kg_entities_embedding_hnsw;
+
+ALTER TABLE documents ALTER COLUMN embedding TYPE halfvec(768) USING NULL;
+ALTER TABLE document_chunks ALTER COLUMN embedding TYPE halfvec(768) USING NULL;
+ALTER TABLE kg_entities ALTER COLUMN embedding TYPE halfvec(768) USING NULL;
+
+CREATE INDEX IF NOT EXISTS documents_embedding_hnsw ON documents USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS document_chunks_embedding_hnsw ON document_chunks USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX IF NOT EXISTS kg_entities_embedding_hnsw ON kg_entities USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64);
+
+COMMIT;
@@ -4,16 +4,22 @@ import json
 import logging
 from typing import List, Dict, Any, Optional, TypedDict, Annotated, Literal
 from dataclasses import dataclass
-from langchain_groq import ChatGroq
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-import google.generativeai as genai
 import streamlit as st
 from langgraph.graph import StateGraph, END, START
 import operator
 
 # Constants
 DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'llama-3.3-70b-versatile')
+MAX_SELECTED_DOCUMENTS = 5
+EVIDENCE_SNIPPET_LENGTH = 300
+CONTEXT_WINDOW_CHARS = 8000
+
+# Patterns for pulling JSON out of LLM responses
+_JSON_OBJ_RE = re.compile(r'\{.*\}', re.DOTALL)
+_JSON_ARR_RE = re.compile(r'\[.*\]', re.DOTALL)
+_SELECTED_IDS_RE = re.compile(r'\{\s*"selected"\s*:\s*\[.*?\]\s*\}', re.DOTALL)
 
 logger = logging.getLogger(__name__)
 
@@ -21,9 +27,11 @@ class AgentState(TypedDict):
     messages: List[BaseMessage]
     next: str
     documents: List[Dict]
+    selected_doc_ids: List[str]
     kg_context: List[Dict]
     analysis: Dict
     response: str
+    context_text: str
 
 @dataclass
 class SearchQuery:
@@ -32,6 +40,29 @@ class SearchQuery:
     context: Dict[str, Any] = None
     constraints: Dict[str, Any] = None
 
+def _parse_selected_doc_ids(content: str) -> List[str]:
+    """Extract the document ids the search agent marked as relevant"""
+    match = _SELECTED_IDS_RE.search(content)
+    if not match:
+        return []
+    try:
+        return [str(doc_id) for doc_id in json.loads(match.group()).get('selected', [])]
+    except (json.JSONDecodeError, AttributeError):
+        return []
+
+def _append_context(state: Dict, content: str) -> None:
+    """Append an agent response to the rolling, char-windowed context"""
+    state["context_text"] = (state.get("context_text", "") + "\n" + content)[-CONTEXT_WINDOW_CHARS:]
+
+def _format_evidence(documents: List[Dict]) -> str:
+    """Render documents as title + snippet lines for downstream prompts"""
+    lines = []
+    for doc in documents:
+        title = doc.get('title') or doc.get('filename') or 'Unknown'
+        snippet = (doc.get('summary') or doc.get('content') or '')[:EVIDENCE_SNIPPET_LENGTH]
+        lines.append(f"- {title}: {snippet}")
+    return "\n".join(lines)
+
 class NASAResearchAgents:
     def __init__(self):
         self.llm = self._initialize_llm()
@@ -43,6 +74,8 @@ class NASAResearchAgents:
         try:
             api_key = os.getenv('GROQ_API_KEY')
             if api_key:
+                # Imported lazily so pages load without the Groq SDK when no key is set
+                from langchain_groq import ChatGroq
                 return ChatGroq(
                     groq_api_key=api_key,
                     model_name=DEFAULT_MODEL,
@@ -58,10 +91,12 @@ class NASAResearchAgents:
         """Initialize Gemini client"""
         try:
             api_key = os.getenv('GOOGLE_API_KEY')
-            if api_key:
-                genai.configure(api_key=api_key)
-                return genai
-            return None
+            if not api_key:
+                return None
+            # Deferred import: google.generativeai pulls in gRPC and protobuf
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            return genai
         except Exception as e:
             logger.error(f"Error initializing Gemini: {e}")
             return None
@@ -81,17 +116,29 @@ class NASAResearchAgents:
                 documents based on user queries. You excel at semantic search and can understand the context 
                 behind research questions.
                 
-                Analyze the provided documents and identify the most relevant ones."""),
+                Analyze the provided documents and identify the most relevant ones.
+                End your answer with a JSON object listing the ids of the relevant documents:
+                {{"selected": ["document id", "document id"]}}"""),
                 ("human", "{query}"),
                 ("human", "Available documents: {documents}")
             ])
-            
+
             messages = prompt.format_messages(
                 query=state["messages"][-1].content,
                 documents=state["documents"]
             )
             response = self.llm.invoke(messages)
             state["messages"].append(response)
+            _append_context(state, response.content)
+
+            # Hand only the selected top-K documents to the downstream agents
+            selected = _parse_selected_doc_ids(response.content)
+            state["selected_doc_ids"] = selected
+            selected_docs = [
+                doc for doc in state["documents"] if str(doc.get('id')) in selected
+            ][:MAX_SELECTED_DOCUMENTS]
+            # Fall back to the top retrieved documents if no selection (or only unknown ids) came back
+            state["documents"] = selected_docs or state["documents"][:MAX_SELECTED_DOCUMENTS]
             return state
         
         def analysis_agent(state: Dict) -> Dict:
@@ -106,13 +153,13 @@ class NASAResearchAgents:
                 ("human", "Knowledge graph context: {kg_context}")
             ])
             
-            context = "\n".join([msg.content for msg in state["messages"]])
             messages = prompt.format_messages(
-                context=context,
+                context=state["context_text"],
                 kg_context=state["kg_context"]
             )
             response = self.llm.invoke(messages)
             state["messages"].append(response)
+            _append_context(state, response.content)
             state["analysis"] = {"findings": response.content}
             return state
             
@@ -134,6 +181,7 @@ class NASAResearchAgents:
             )
             response = self.llm.invoke(messages)
             state["messages"].append(response)
+            _append_context(state, response.content)
             state["response"] = response.content
             return state
             
@@ -151,10 +199,11 @@ class NASAResearchAgents:
             
             messages = prompt.format_messages(
                 response=state["response"],
-                documents=state["documents"]
+                documents=_format_evidence(state["documents"])
             )
             response = self.llm.invoke(messages)
             state["messages"].append(response)
+            _append_context(state, response.content)
             return state
             
         # Create the workflow graph
@@ -192,9 +241,11 @@ class NASAResearchAgents:
                 "messages": [HumanMessage(content=query.query)],
                 "next": "search",
                 "documents": relevant_docs,
+                "selected_doc_ids": [],
                 "kg_context": kg_context,
                 "analysis": {},
-                "response": ""
+                "response": "",
+                "context_text": query.query
             }
             
             # Execute the graph
@@ -257,7 +308,7 @@ class NASAResearchAgents:
             response = self.llm.invoke(messages)
             
             # Extract JSON from response
-            json_match = re.search(r'\{.*\}', response.content, re.DOTALL)
+            json_match = _JSON_OBJ_RE.search(response.content)
             if json_match:
                 classification = json.loads(json_match.group())
                 return SearchQuery(
@@ -304,7 +355,7 @@ class NASAResearchAgents:
             response = self.llm.invoke(messages)
             
             # Extract JSON from response
-            json_match = re.search(r'\[.*\]', response.content, re.DOTALL)
+            json_match = _JSON_ARR_RE.search(response.content)
             if json_match:
                 questions = json.loads(json_match.group())
                 return questions[:5]  # Limit to 5 questions
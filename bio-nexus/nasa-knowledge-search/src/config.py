@@ -5,6 +5,7 @@ Configuration management for NASA Knowledge Search Engine
 import os
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
+from functools import cached_property
 import logging
 
 logger = logging.getLogger(__name__)
@@ -46,32 +47,35 @@ class AppConfig:
     similarity_threshold: float = 0.7
 
 class ConfigManager:
-    """Configuration manager for the application"""
-    
-    def __init__(self):
-        self._load_from_env()
+    """Configuration manager for the application
+
+    Each section is read from the environment on first access and memoized.
+    """
     
-    def _load_from_env(self):
-        """Load configuration from environment variables"""
-        
-        # Database configuration
-        self.database = DatabaseConfig(
+    @cached_property
+    def database(self) -> DatabaseConfig:
+        """Database configuration from environment variables"""
+        return DatabaseConfig(
             host=os.getenv('POSTGRES_HOST', 'localhost'),
             port=int(os.getenv('POSTGRES_PORT', '5432')),
             database=os.getenv('POSTGRES_DB', 'nasa_knowledge'),
             user=os.getenv('POSTGRES_USER', 'nasa_user'),
             password=os.getenv('POSTGRES_PASSWORD', 'nasa_password')
         )
-        
-        # Neo4j configuration
-        self.neo4j = Neo4jConfig(
+    
+    @cached_property
+    def neo4j(self) -> Neo4jConfig:
+        """Neo4j configuration from environment variables"""
+        return Neo4jConfig(
             uri=os.getenv('NEO4J_URI', 'bolt://localhost:7687'),
             user=os.getenv('NEO4J_USER', 'neo4j'),
             password=os.getenv('NEO4J_PASSWORD', 'neo4j_password')
         )
-        
-        # AI configuration
-        self.ai = AIConfig(
+    
+    @cached_property
+    def ai(self) -> AIConfig:
+        """AI configuration from environment variables"""
+        return AIConfig(
             groq_api_key=os.getenv('GROQ_API_KEY', ''),
             google_api_key=os.getenv('GOOGLE_API_KEY', ''),
             embedding_model=os.getenv('EMBEDDING_MODEL', 'all-MiniLM-L6-v2'),
@@ -79,9 +83,11 @@ class ConfigManager:
             temperature=float(os.getenv('TEMPERATURE', '0.1')),
             max_tokens=int(os.getenv('MAX_TOKENS', '32768'))
         )
-        
-        # Application configuration
-        self.app = AppConfig(
+    
+    @cached_property
+    def app(self) -> AppConfig:
+        """Application configuration from environment variables"""
+        return AppConfig(
             app_name=os.getenv('APP_NAME', 'NASA Knowledge Search'),
             app_version=os.getenv('APP_VERSION', '1.0.0'),
             debug=os.getenv('DEBUG', 'False').lower() == 'true',
@@ -1,13 +1,102 @@
 import os
+import io
+import json
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.pool import ThreadedConnectionPool
+from pgvector.psycopg2 import register_vector
+import numpy as np
 import streamlit as st
 from typing import List, Dict, Any, Optional
 import logging
+import threading
 from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+INSERT_DOCUMENT_QUERY = """
+INSERT INTO documents (filename, title, content, summary, file_type, file_size, metadata, embedding)
+VALUES (%(filename)s, %(title)s, %(content)s, %(summary)s, %(file_type)s, %(file_size)s, %(metadata)s, %(embedding)s)
+RETURNING id
+"""
+
+INSERT_CHUNKS_QUERY = """
+INSERT INTO document_chunks (document_id, chunk_index, content, chunk_type, page_number, embedding, metadata)
+VALUES %s
+RETURNING id
+"""
+
+CHUNK_VALUES_TEMPLATE = "(%(document_id)s, %(chunk_index)s, %(content)s, %(chunk_type)s, %(page_number)s, %(embedding)s, %(metadata)s)"
+
+CHUNK_COPY_COLUMNS = ('document_id', 'chunk_index', 'content', 'chunk_type', 'page_number', 'embedding', 'metadata')
+
+COPY_CHUNKS_QUERY = f"COPY document_chunks ({', '.join(CHUNK_COPY_COLUMNS)}) FROM STDIN"
+
+def _copy_field(value) -> str:
+    """Encode a value for COPY text format"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+def _vector_to_list(value) -> List[float]:
+    """Convert a fetched pgvector value (numpy array or text literal) to a list"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return json.loads(value)
+
+# Rows fetched per round-trip when streaming through a server-side cursor
+STREAM_BATCH_SIZE = 1000
+
+# Hot read queries, prepared once per pooled connection so the server parses and plans them once.
+# Embeddings are passed once as $1 and cast to halfvec; unit-length vectors make <#> rank like cosine.
+# Similarity searches take a minimum similarity as $3 so rejected rows never leave the server.
+PREPARED_QUERIES = {
+    'search_similar_documents': """
+    SELECT d.*, (d.embedding <#> $1::halfvec) * -1 as similarity
+    FROM documents d
+    WHERE d.embedding IS NOT NULL
+      AND (d.embedding <#> $1::halfvec) * -1 >= $3
+    ORDER BY d.embedding <#> $1::halfvec
+    LIMIT $2
+    """,
+    'search_similar_chunks': """
+    SELECT dc.id, dc.document_id, dc.chunk_index, dc.content, dc.chunk_type, dc.page_number,
+           d.filename, d.title, (dc.embedding <#> $1::halfvec) * -1 as similarity
+    FROM document_chunks dc
+    JOIN documents d ON dc.document_id = d.id
+    WHERE dc.embedding IS NOT NULL
+      AND (dc.embedding <#> $1::halfvec) * -1 >= $3
+    ORDER BY dc.embedding <#> $1::halfvec
+    LIMIT $2
+    """,
+    'get_chat_messages': """
+    SELECT * FROM chat_messages
+    WHERE session_id = $1
+    ORDER BY timestamp ASC
+    """
+}
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which PREPARED_QUERIES it has already prepared"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+
+# HNSW indexes for the inner-product similarity searches
+VECTOR_INDEX_QUERIES = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_embedding_hnsw
+    ON documents USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64)
+    """,
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS document_chunks_embedding_hnsw
+    ON document_chunks USING hnsw (embedding halfvec_ip_ops) WITH (m = 16, ef_construction = 64)
+    """
+]
+
 class DatabaseManager:
     def __init__(self):
         self.connection_params = {
@@ -17,137 +106,294 @@ class DatabaseManager:
             'user': os.getenv('POSTGRES_USER', 'nasa_user'),
             'password': os.getenv('POSTGRES_PASSWORD', 'nasa_password')
         }
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        ef_search = os.getenv('HNSW_EF_SEARCH')
+        self.hnsw_ef_search = int(ef_search) if ef_search else None
+        self._vector_indexes_ready = False
+        
+        try:
+            self.ensure_vector_indexes()
+        except Exception as e:
+            logger.warning(f"Could not ensure vector indexes: {e}")
+    
+    def _get_pool(self) -> ThreadedConnectionPool:
+        """Create the connection pool on first use"""
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    pool = ThreadedConnectionPool(
+                        minconn=2,
+                        maxconn=int(os.getenv('PG_POOL_MAX', '20')),
+                        connection_factory=PreparingConnection,
+                        **self.connection_params
+                    )
+                    # Let numpy arrays bind directly as pgvector values
+                    conn = pool.getconn()
+                    try:
+                        register_vector(conn, globally=True)
+                    finally:
+                        pool.putconn(conn)
+                    self.pool = pool
+        return self.pool
     
     @contextmanager
     def get_connection(self):
-        """Context manager for database connections"""
+        """Context manager for pooled database connections"""
+        pool = None
         conn = None
         try:
-            conn = psycopg2.connect(**self.connection_params)
+            pool = self._get_pool()
+            conn = pool.getconn()
             yield conn
         except Exception as e:
-            if conn:
+            if conn and not conn.closed:
                 conn.rollback()
             logger.error(f"Database error: {e}")
             raise
         finally:
             if conn:
-                conn.close()
+                # Never hand a connection with an open transaction back to the pool
+                if not conn.closed and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                pool.putconn(conn, close=bool(conn.closed))
     
-    def execute_query(self, query: str, params: tuple = None, fetch: bool = True) -> List[Dict]:
-        """Execute a query and return results"""
+    def close(self):
+        """Close all pooled connections"""
+        if self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
+    
+    def ensure_vector_indexes(self):
+        """Create the HNSW embedding indexes if they do not exist yet"""
+        if self._vector_indexes_ready:
+            return
+        
+        with self.get_connection() as conn:
+            # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+            conn.autocommit = True
+            try:
+                with conn.cursor() as cursor:
+                    for query in VECTOR_INDEX_QUERIES:
+                        cursor.execute(query)
+            finally:
+                conn.autocommit = False
+        
+        self._vector_indexes_ready = True
+    
+    def execute_query(self, query: str, params: tuple = None, fetch: bool = True,
+                      ef_search: Optional[int] = None, stream: bool = False):
+        """Execute a query and return results
+        
+        ef_search sets hnsw.ef_search for this query's transaction only, trading speed for recall.
+        stream returns a generator over a server-side cursor instead of a fetched list.
+        """
+        if stream:
+            return self._stream_query(query, params)
+        
         with self.get_connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                if ef_search:
+                    cursor.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
                 cursor.execute(query, params)
                 if fetch:
                     return [dict(row) for row in cursor.fetchall()]
                 conn.commit()
                 return []
     
+    def _stream_query(self, query: str, params: tuple = None):
+        """Yield rows from a named cursor, fetching STREAM_BATCH_SIZE at a time"""
+        with self.get_connection() as conn:
+            with conn.cursor(name='stream_cur', cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = STREAM_BATCH_SIZE
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield dict(row)
+    
+    def execute_prepared(self, name: str, params: tuple, ef_search: Optional[int] = None) -> List[Dict]:
+        """Run one of PREPARED_QUERIES, preparing it on this connection the first time"""
+        with self.get_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                if ef_search:
+                    cursor.execute("SET LOCAL hnsw.ef_search = %s", (ef_search,))
+                if name not in conn.prepared_statements:
+                    cursor.execute(f"PREPARE {name} AS {PREPARED_QUERIES[name]}")
+                    conn.prepared_statements.add(name)
+                placeholders = ', '.join(['%s'] * len(params))
+                cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+                return [dict(row) for row in cursor.fetchall()]
+    
     def insert_document(self, document_data: Dict) -> str:
         """Insert a new document and return its ID"""
         
-        # Validate and clean embedding data
-        embedding = document_data.get('embedding')
-        if embedding is not None:
-            # Check if embedding is valid
-            if isinstance(embedding, (list, dict)) and not embedding:
-                # Empty list or dict, set to None
-                document_data['embedding'] = None
-                logger.warning("Empty embedding detected, setting to NULL")
-            elif isinstance(embedding, str):
-                # Ensure it's a proper vector format
-                if not (embedding.startswith('[') and embedding.endswith(']')):
-                    document_data['embedding'] = None
-                    logger.warning(f"Invalid embedding format: {embedding[:50]}..., setting to NULL")
-            elif not isinstance(embedding, str):
-                # Not a string, convert to proper format or set to None
-                document_data['embedding'] = None
-                logger.warning(f"Invalid embedding type: {type(embedding)}, setting to NULL")
+        self._clean_embedding(document_data)
+        
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(INSERT_DOCUMENT_QUERY, document_data)
+                document_id = cursor.fetchone()[0]
+                conn.commit()
+                return str(document_id)
+    
+    def insert_document_chunk(self, chunk_data: Dict) -> str:
+        """Insert a document chunk and return its ID"""
+        
+        self._clean_embedding(chunk_data, 'chunk')
         
         query = """
-        INSERT INTO documents (filename, title, content, summary, file_type, file_size, metadata, embedding)
-        VALUES (%(filename)s, %(title)s, %(content)s, %(summary)s, %(file_type)s, %(file_size)s, %(metadata)s, %(embedding)s)
+        INSERT INTO document_chunks (document_id, chunk_index, content, chunk_type, page_number, embedding, metadata)
+        VALUES (%(document_id)s, %(chunk_index)s, %(content)s, %(chunk_type)s, %(page_number)s, %(embedding)s, %(metadata)s)
         RETURNING id
         """
         
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query, document_data)
+                cursor.execute(query, chunk_data)
+                chunk_id = cursor.fetchone()[0]
+                conn.commit()
+                return str(chunk_id)
+    
+    def insert_document_chunks(self, chunks: List[Dict]) -> List[str]:
+        """Insert a batch of document chunks in a single statement and return their IDs"""
+        if not chunks:
+            return []
+        
+        for chunk_data in chunks:
+            self._clean_embedding(chunk_data, 'chunk')
+        
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                chunk_ids = self._execute_chunk_batch(cursor, chunks)
+                conn.commit()
+                return chunk_ids
+    
+    def ingest_document(self, document_data: Dict, chunks: List[Dict] = None, use_copy: bool = False) -> str:
+        """Insert a document and its chunks in one transaction and return the document ID
+        
+        Chunks do not need a document_id; it is filled in from the inserted document.
+        With use_copy the chunks are loaded with COPY, falling back to a multi-row INSERT.
+        """
+        chunks = chunks or []
+        
+        self._clean_embedding(document_data)
+        for chunk_data in chunks:
+            self._clean_embedding(chunk_data, 'chunk')
+        
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(INSERT_DOCUMENT_QUERY, document_data)
                 document_id = cursor.fetchone()[0]
+                
+                if chunks:
+                    for chunk_data in chunks:
+                        chunk_data['document_id'] = document_id
+                    if use_copy:
+                        self._copy_chunk_batch_or_insert(cursor, chunks)
+                    else:
+                        self._execute_chunk_batch(cursor, chunks)
+                
                 conn.commit()
                 return str(document_id)
     
-    def insert_document_chunk(self, chunk_data: Dict) -> str:
-        """Insert a document chunk and return its ID"""
+    def _copy_chunk_batch_or_insert(self, cursor, chunks: List[Dict]):
+        """COPY chunk rows, retrying as a multi-row INSERT if COPY is rejected"""
+        cursor.execute("SAVEPOINT chunk_copy")
+        try:
+            self._copy_chunk_batch(cursor, chunks)
+        except psycopg2.Error as e:
+            logger.warning(f"COPY of document chunks failed, falling back to INSERT: {e}")
+            cursor.execute("ROLLBACK TO SAVEPOINT chunk_copy")
+            self._execute_chunk_batch(cursor, chunks)
+        cursor.execute("RELEASE SAVEPOINT chunk_copy")
+    
+    def _copy_chunk_batch(self, cursor, chunks: List[Dict]):
+        """Stream chunk rows to COPY in text format on the given cursor"""
+        lines = []
+        for chunk_data in chunks:
+            lines.append('\t'.join(_copy_field(chunk_data.get(column)) for column in CHUNK_COPY_COLUMNS))
+        cursor.copy_expert(COPY_CHUNKS_QUERY, io.StringIO('\n'.join(lines) + '\n'))
+    
+    def _execute_chunk_batch(self, cursor, chunks: List[Dict]) -> List[str]:
+        """Insert chunk rows with a single multi-row INSERT on the given cursor"""
+        rows = execute_values(
+            cursor, INSERT_CHUNKS_QUERY, chunks,
+            template=CHUNK_VALUES_TEMPLATE, page_size=500, fetch=True
+        )
+        return [str(row[0]) for row in rows]
+    
+    def _clean_embedding(self, data: Dict, kind: str = ''):
+        """Replace an invalid embedding with NULL"""
+        label = f"{kind} embedding" if kind else "embedding"
         
         # Validate and clean embedding data
-        embedding = chunk_data.get('embedding')
+        embedding = data.get('embedding')
         if embedding is not None:
             # Check if embedding is valid
             if isinstance(embedding, (list, dict)) and not embedding:
                 # Empty list or dict, set to None
-                chunk_data['embedding'] = None
-                logger.warning("Empty chunk embedding detected, setting to NULL")
+                data['embedding'] = None
+                logger.warning(f"Empty {label} detected, setting to NULL")
             elif isinstance(embedding, str):
                 # Ensure it's a proper vector format
                 if not (embedding.startswith('[') and embedding.endswith(']')):
-                    chunk_data['embedding'] = None
-                    logger.warning(f"Invalid chunk embedding format: {embedding[:50]}..., setting to NULL")
+                    data['embedding'] = None
+                    logger.warning(f"Invalid {label} format: {embedding[:50]}..., setting to NULL")
             elif not isinstance(embedding, str):
                 # Not a string, convert to proper format or set to None
-                chunk_data['embedding'] = None
-                logger.warning(f"Invalid chunk embedding type: {type(embedding)}, setting to NULL")
-        
-        query = """
-        INSERT INTO document_chunks (document_id, chunk_index, content, chunk_type, page_number, embedding, metadata)
-        VALUES (%(document_id)s, %(chunk_index)s, %(content)s, %(chunk_type)s, %(page_number)s, %(embedding)s, %(metadata)s)
-        RETURNING id
-        """
-        
+                data['embedding'] = None
+                logger.warning(f"Invalid {label} type: {type(embedding)}, setting to NULL")
+    
+    def get_cached_embeddings(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Fetch cached embeddings for the given content hashes"""
+        query = "SELECT sha, embedding FROM embedding_cache WHERE sha = ANY(%s)"
+        rows = self.execute_query(query, ([psycopg2.Binary(key) for key in keys],))
+        return {bytes(row['sha']): _vector_to_list(row['embedding']) for row in rows}
+    
+    def store_cached_embeddings(self, embeddings: Dict[bytes, List[float]]):
+        """Cache embeddings by content hash, keeping any existing entry"""
+        query = "INSERT INTO embedding_cache (sha, embedding) VALUES %s ON CONFLICT (sha) DO NOTHING"
+        rows = [
+            (psycopg2.Binary(key), np.asarray(embedding, dtype=np.float32))
+            for key, embedding in embeddings.items()
+        ]
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query, chunk_data)
-                chunk_id = cursor.fetchone()[0]
+                execute_values(cursor, query, rows, page_size=500)
                 conn.commit()
-                return str(chunk_id)
     
-    def search_similar_documents(self, query_embedding: List[float], limit: int = 10) -> List[Dict]:
-        """Search for similar documents using vector similarity"""
-        query = """
-        SELECT d.*, 1 - (d.embedding <=> %s) as similarity
-        FROM documents d
-        WHERE d.embedding IS NOT NULL
-        ORDER BY d.embedding <=> %s
-        LIMIT %s
-        """
+    def search_similar_documents(self, query_embedding: List[float], limit: int = 10,
+                                 similarity_threshold: float = -1.0) -> List[Dict]:
+        """Search for similar documents using vector similarity
         
-        embedding_str = f"[{','.join(map(str, query_embedding))}]"
-        return self.execute_query(query, (embedding_str, embedding_str, limit))
+        Embeddings are unit length, so negative inner product ranks the same as cosine distance.
+        The default threshold of -1.0 is the lowest possible similarity and keeps every row.
+        """
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        return self.execute_prepared('search_similar_documents', (embedding, limit, similarity_threshold),
+                                     ef_search=self.hnsw_ef_search)
     
-    def search_similar_chunks(self, query_embedding: List[float], limit: int = 20) -> List[Dict]:
+    def search_similar_chunks(self, query_embedding: List[float], limit: int = 20,
+                              similarity_threshold: float = -1.0) -> List[Dict]:
         """Search for similar document chunks using vector similarity"""
-        query = """
-        SELECT dc.*, d.filename, d.title, 1 - (dc.embedding <=> %s) as similarity
-        FROM document_chunks dc
-        JOIN documents d ON dc.document_id = d.id
-        WHERE dc.embedding IS NOT NULL
-        ORDER BY dc.embedding <=> %s
-        LIMIT %s
-        """
-        
-        embedding_str = f"[{','.join(map(str, query_embedding))}]"
-        return self.execute_query(query, (embedding_str, embedding_str, limit))
+        # Projects only what callers use; the embedding and metadata columns are not sent back
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        return self.execute_prepared('search_similar_chunks', (embedding, limit, similarity_threshold),
+                                     ef_search=self.hnsw_ef_search)
     
-    def get_all_documents(self) -> List[Dict]:
-        """Get all documents with basic info"""
+    def get_all_documents(self, stream: bool = False):
+        """Get all documents with basic info, optionally as a lazy row stream"""
         query = """
         SELECT id, filename, title, file_type, file_size, upload_date, 
                CASE WHEN processed_date IS NOT NULL THEN true ELSE false END as processed
         FROM documents
         ORDER BY upload_date DESC
         """
-        return self.execute_query(query)
+        return self.execute_query(query, stream=stream)
+    
+    def count_documents(self) -> int:
+        """Count stored documents without fetching them"""
+        results = self.execute_query("SELECT COUNT(*) AS count FROM documents")
+        return results[0]['count'] if results else 0
     
     def get_document_by_id(self, document_id: str) -> Optional[Dict]:
         """Get a specific document by ID"""
@@ -160,9 +406,7 @@ class DatabaseManager:
         try:
             with self.get_connection() as conn:
                 with conn.cursor() as cursor:
-                    # Delete chunks first (foreign key constraint)
-                    cursor.execute("DELETE FROM document_chunks WHERE document_id = %s", (document_id,))
-                    # Delete document
+                    # Chunks are removed by the ON DELETE CASCADE foreign key
                     cursor.execute("DELETE FROM documents WHERE id = %s", (document_id,))
                     conn.commit()
                     return True
@@ -187,46 +431,41 @@ class DatabaseManager:
     
     def get_chat_sessions(self) -> List[Dict]:
         """Get all chat sessions"""
+        # message_count and last_message_time are maintained by add_chat_message
         query = """
-        SELECT cs.*, 
-               COUNT(cm.id) as message_count,
-               MAX(cm.timestamp) as last_message_time
-        FROM chat_sessions cs
-        LEFT JOIN chat_messages cm ON cs.id = cm.session_id
-        GROUP BY cs.id
-        ORDER BY cs.last_updated DESC
+        SELECT * FROM chat_sessions
+        ORDER BY last_updated DESC
         """
         return self.execute_query(query)
     
     def get_chat_messages(self, session_id: str) -> List[Dict]:
         """Get all messages for a chat session"""
-        query = """
-        SELECT * FROM chat_messages 
-        WHERE session_id = %s 
-        ORDER BY timestamp ASC
-        """
-        return self.execute_query(query, (session_id,))
+        return self.execute_prepared('get_chat_messages', (session_id,))
     
     def add_chat_message(self, session_id: str, message_type: str, content: str, sources: List[Dict] = None) -> str:
         """Add a message to a chat session"""
+        # Insert the message and touch the session in a single round-trip
         query = """
-        INSERT INTO chat_messages (session_id, message_type, content, sources)
-        VALUES (%s, %s, %s, %s)
-        RETURNING id
+        WITH ins AS (
+            INSERT INTO chat_messages (session_id, message_type, content, sources)
+            VALUES (%s, %s, %s, %s)
+            RETURNING id
+        ), upd AS (
+            UPDATE chat_sessions
+            SET last_updated = CURRENT_TIMESTAMP,
+                message_count = message_count + 1,
+                last_message_time = CURRENT_TIMESTAMP
+            WHERE id = %s
+        )
+        SELECT id FROM ins
         """
         
         sources_json = sources if sources else []
         
         with self.get_connection() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(query, (session_id, message_type, content, psycopg2.extras.Json(sources_json)))
+                cursor.execute(query, (session_id, message_type, content, psycopg2.extras.Json(sources_json), session_id))
                 message_id = cursor.fetchone()[0]
-                
-                # Update session last_updated
-                cursor.execute(
-                    "UPDATE chat_sessions SET last_updated = CURRENT_TIMESTAMP WHERE id = %s",
-                    (session_id,)
-                )
                 conn.commit()
                 return str(message_id)
     
@@ -260,14 +499,14 @@ class DatabaseManager:
                 conn.commit()
                 return str(relationship_id)
     
-    def get_kg_entities(self, entity_type: str = None, limit: int = 100) -> List[Dict]:
-        """Get knowledge graph entities"""
+    def get_kg_entities(self, entity_type: str = None, limit: int = 100, stream: bool = False):
+        """Get knowledge graph entities, optionally as a lazy row stream"""
         if entity_type:
             query = "SELECT * FROM kg_entities WHERE entity_type = %s LIMIT %s"
-            return self.execute_query(query, (entity_type, limit))
+            return self.execute_query(query, (entity_type, limit), stream=stream)
         else:
             query = "SELECT * FROM kg_entities LIMIT %s"
-            return self.execute_query(query, (limit,))
+            return self.execute_query(query, (limit,), stream=stream)
     
     def get_kg_relationships(self, entity_id: str = None) -> List[Dict]:
         """Get knowledge graph relationships"""
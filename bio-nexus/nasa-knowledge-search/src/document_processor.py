@@ -14,37 +14,125 @@ except ImportError:
     DOCLING_AVAILABLE = False
     logger.warning("Docling not available, using fallback PDF processing")
 
-import google.generativeai as genai
-from groq import Groq
 import json
 import re
 from pathlib import Path
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from src.embedding_cache import EmbeddingCache
 
 logger = logging.getLogger(__name__)
 
+# Parallel requests used when a batched embedding call is not available
+EMBEDDING_WORKERS = 8
+
+WORD_PATTERN = re.compile(r'\S+')
+
+DEFAULT_MODEL = os.getenv('DEFAULT_MODEL', 'llama-3.3-70b-versatile')
+
+# Simple patterns for NASA-related entities used by the fallback extractor
+ENTITY_PATTERNS = (
+    ('Space Mission', re.compile(r'\b[A-Z][a-z]+-\d+\b|\bISS\b|\bInternational Space Station\b', re.IGNORECASE)),
+    ('Organism', re.compile(r'\b[A-Z][a-z]+ [a-z]+\b(?=.*(?:mouse|mice|rat|cell|organism))', re.IGNORECASE)),
+    ('Chemical', re.compile(r'\b[A-Z][a-zA-Z]*\d+\b|\b[A-Z]{2,}\b', re.IGNORECASE)),
+    ('Equipment', re.compile(r'\bmicroscop[ey]\b|\bspectromet[ery]\b|\bchamber\b|\bbioreactor\b', re.IGNORECASE))
+)
+
+ENTITY_PROMPT_TEMPLATE = """
+            Extract scientific entities from the following NASA research text. 
+            Focus on:
+            - Research topics and phenomena
+            - Scientific instruments and equipment
+            - Biological systems and organisms
+            - Chemical compounds and materials
+            - Space missions and experiments
+            - Researchers and institutions
+            - Locations (space stations, planets, etc.)
+            
+            Return a JSON object with the entities in this format:
+            {{
+                "entities": [
+                    {{
+                        "name": "entity name",
+                        "type": "entity type",
+                        "description": "brief description"
+                    }}
+                ]
+            }}
+            
+            Text:
+            {text}  # Limit input
+            """
+
+RELATIONSHIP_PROMPT_TEMPLATE = """
+            Given these entities found in a NASA research document: {entity_names}
+            
+            Identify relationships between these entities based on the following text.
+            Return a JSON object with the relationships in this format:
+            {{
+                "relationships": [
+                    {{
+                        "source": "entity1",
+                        "target": "entity2",
+                        "relationship": "relationship_type",
+                        "description": "brief description of the relationship"
+                    }}
+                ]
+            }}
+            
+            Common relationship types for NASA research:
+            - studies, analyzes, affects, influences, contains, produces, uses, involves, measures
+            
+            Text:
+            {text}
+            """
+
+# Optional small PDF converted once so Docling loads its layout/OCR models up front
+DOCLING_WARMUP_PDF = os.getenv('DOCLING_WARMUP_PDF')
+
+def _normalize(embedding: List[float]) -> List[float]:
+    """Scale an embedding to unit length; similarity search relies on this for inner product"""
+    vector = np.asarray(embedding, dtype=np.float64)
+    norm = np.linalg.norm(vector)
+    if not norm:
+        return embedding
+    return (vector / norm).tolist()
+
+@st.cache_resource
+def get_docling_converter():
+    """Build one Docling converter per process, warming its models up if configured"""
+    if not DOCLING_AVAILABLE:
+        return None
+    try:
+        converter = DocumentConverter()
+    except Exception as e:
+        logger.error(f"Error initializing Docling converter: {e}")
+        return None
+    
+    if DOCLING_WARMUP_PDF and Path(DOCLING_WARMUP_PDF).exists():
+        try:
+            converter.convert(DOCLING_WARMUP_PDF)
+        except Exception as e:
+            logger.warning(f"Docling warm-up failed: {e}")
+    return converter
+
 class DocumentProcessor:
     def __init__(self):
         self.embedding_model = self._load_embedding_model()
+        self.embedding_cache = EmbeddingCache(self.embedding_model)
         self.docling_converter = self._load_docling_converter()
         self.groq_client = self._initialize_groq()
-        self._initialize_gemini()
+        self.genai = self._initialize_gemini()
     
     def reinitialize_with_api_keys(self):
         """Reinitialize the processor with new API keys from session state"""
         self.groq_client = self._initialize_groq()
-        self._initialize_gemini()
+        self.genai = self._initialize_gemini()
         logger.info("Document processor reinitialized with new API keys")
     
     def _load_docling_converter(self):
-        """Load Docling converter if available"""
-        if DOCLING_AVAILABLE:
-            try:
-                return DocumentConverter()
-            except Exception as e:
-                logger.error(f"Error initializing Docling converter: {e}")
-                return None
-        return None
+        """Load the shared Docling converter if available"""
+        return get_docling_converter()
     
     def _load_embedding_model(self):
         """Using Gemini for embeddings instead of SentenceTransformer"""
@@ -62,6 +150,8 @@ class DocumentProcessor:
                 api_key = os.getenv('GROQ_API_KEY')
             
             if api_key:
+                # Imported lazily so pages load without the Groq SDK when no key is set
+                from groq import Groq
                 return Groq(api_key=api_key)
             return None
         except Exception as e:
@@ -78,10 +168,15 @@ class DocumentProcessor:
             else:
                 api_key = os.getenv('GOOGLE_API_KEY')
             
-            if api_key:
-                genai.configure(api_key=api_key)
+            if not api_key:
+                return None
+            # Deferred import: google.generativeai pulls in gRPC and protobuf
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            return genai
         except Exception as e:
             logger.error(f"Error initializing Gemini: {e}")
+            return None
     
     def process_pdf_with_docling(self, file_path: str) -> Dict[str, Any]:
         """Process PDF using Docling for accurate extraction"""
@@ -182,29 +277,37 @@ class DocumentProcessor:
     
     def _extract_title_from_text(self, text: str) -> str:
         """Extract title from raw text"""
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
+        # Walk line by line so large texts are not split up front
+        start = 0
+        while start <= len(text):
+            end = text.find('\n', start)
+            if end < 0:
+                end = len(text)
+            line = text[start:end].strip()
             if len(line) > 10 and len(line) < 200:
                 return line
+            start = end + 1
         return "Untitled Document"
     
     def chunk_document(self, content: str, chunk_size: int = 1000, overlap: int = 200) -> List[Dict]:
         """Chunk document content into smaller pieces"""
         try:
             chunks = []
-            words = content.split()
-            
-            for i in range(0, len(words), chunk_size - overlap):
-                chunk_words = words[i:i + chunk_size]
-                chunk_text = ' '.join(chunk_words)
+            # Word start offsets; chunks are sliced straight out of the original string
+            offsets = [match.start() for match in WORD_PATTERN.finditer(content)]
+            num_words = len(offsets)
+            offsets.append(len(content))
+            
+            for i in range(0, num_words, chunk_size - overlap):
+                end_idx = min(i + chunk_size, num_words)
+                chunk_text = content[offsets[i]:offsets[end_idx]].rstrip()
                 
-                if chunk_text.strip():
+                if chunk_text:
                     chunks.append({
                         'content': chunk_text,
                         'chunk_index': len(chunks),
                         'chunk_type': 'text',
-                        'word_count': len(chunk_words)
+                        'word_count': end_idx - i
                     })
             
             return chunks
@@ -220,30 +323,72 @@ class DocumentProcessor:
         
         try:
             if isinstance(texts, str):
-                # Single text
-                result = genai.embed_content(model=self.embedding_model, content=texts)
-                embedding = result.get('embedding')
-                if embedding and isinstance(embedding, list) and len(embedding) > 0:
-                    return embedding
-                else:
+                # Single text, usually a search query: skip the Postgres cache round-trip
+                embedding = self._cached_embeddings([texts], persistent=False)[0]
+                if embedding is None:
                     logger.warning("Empty or invalid embedding returned from Gemini")
-                    return None
+                return embedding
             else:
                 # Multiple texts
-                embeddings = []
-                for text in texts:
-                    result = genai.embed_content(model=self.embedding_model, content=text)
-                    embedding = result.get('embedding')
-                    if embedding and isinstance(embedding, list) and len(embedding) > 0:
-                        embeddings.append(embedding)
-                    else:
-                        logger.warning(f"Empty or invalid embedding for text: {text[:50]}...")
-                        embeddings.append(None)
+                texts = list(texts)
+                if not texts:
+                    return None
+                
+                embeddings = self._cached_embeddings(texts)
                 return embeddings if embeddings else None
         except Exception as e:
             logger.error(f"Error generating embeddings with Gemini: {e}")
             return None
     
+    def _cached_embeddings(self, texts: List[str], persistent: bool = True) -> List[Optional[List[float]]]:
+        """Resolve embeddings from the cache, sending only unseen texts to Gemini"""
+        keys = [self.embedding_cache.key(text) for text in texts]
+        cached = self.embedding_cache.get_many(list(dict.fromkeys(keys)), persistent=persistent)
+        
+        # Deduplicate misses so repeated chunks are embedded once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        
+        fresh = {}
+        if missing:
+            raw_embeddings = self._embed_batch(list(missing.values()))
+            for (key, text), embedding in zip(missing.items(), raw_embeddings):
+                if embedding and isinstance(embedding, list) and len(embedding) > 0:
+                    fresh[key] = _normalize(embedding)
+                elif len(texts) > 1:
+                    logger.warning(f"Empty or invalid embedding for text: {text[:50]}...")
+            self.embedding_cache.put_many(fresh, persistent=persistent)
+        
+        return [cached.get(key, fresh.get(key)) for key in keys]
+    
+    def _embed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed texts in one request, falling back to parallel per-text requests"""
+        if not self.genai:
+            logger.warning("Gemini is not configured, skipping embeddings")
+            return [None] * len(texts)
+        
+        try:
+            result = self.genai.embed_content(model=self.embedding_model, content=texts)
+            embeddings = result.get('embedding') or []
+            if len(embeddings) == len(texts):
+                return embeddings
+            logger.warning(f"Batched embedding returned {len(embeddings)} vectors for {len(texts)} texts")
+        except Exception as e:
+            logger.warning(f"Batched embedding request failed, falling back to per-text requests: {e}")
+        
+        with ThreadPoolExecutor(max_workers=EMBEDDING_WORKERS) as executor:
+            return list(executor.map(self._embed_one, texts))
+    
+    def _embed_one(self, text: str) -> Optional[List[float]]:
+        """Embed a single text, returning None on failure"""
+        try:
+            return self.genai.embed_content(model=self.embedding_model, content=text).get('embedding')
+        except Exception as e:
+            logger.error(f"Error generating embedding for text: {text[:50]}...: {e}")
+            return None
+    
     def summarize_document(self, content: str, max_length: int = 500) -> str:
         """Generate a summary of the document using Groq"""
         try:
@@ -260,7 +405,7 @@ class DocumentProcessor:
             """
             
             response = self.groq_client.chat.completions.create(
-                model=os.getenv('DEFAULT_MODEL', 'llama-3.3-70b-versatile'),
+                model=DEFAULT_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=max_length * 2,
                 temperature=0.1
@@ -274,9 +419,14 @@ class DocumentProcessor:
     
     def _fallback_summarize(self, content: str, max_length: int = 500) -> str:
         """Fallback summarization method"""
-        sentences = content.split('.')
-        summary_sentences = sentences[:3]  # Take first 3 sentences
-        summary = '. '.join(summary_sentences)
+        # Take first 3 sentences by locating the third '.' instead of splitting the whole text
+        end = -1
+        for _ in range(3):
+            end = content.find('.', end + 1)
+            if end < 0:
+                end = len(content)
+                break
+        summary = content[:end].replace('.', '. ')
         
         if len(summary) > max_length:
             summary = summary[:max_length] + "..."
@@ -289,46 +439,19 @@ class DocumentProcessor:
             if not self.groq_client:
                 return self._fallback_extract_entities(text)
             
-            prompt = f"""
-            Extract scientific entities from the following NASA research text. 
-            Focus on:
-            - Research topics and phenomena
-            - Scientific instruments and equipment
-            - Biological systems and organisms
-            - Chemical compounds and materials
-            - Space missions and experiments
-            - Researchers and institutions
-            - Locations (space stations, planets, etc.)
-            
-            Return the entities as a JSON list with the format:
-            [
-                {{
-                    "name": "entity name",
-                    "type": "entity type",
-                    "description": "brief description"
-                }}
-            ]
-            
-            Text:
-            {text[:3000]}  # Limit input
-            """
+            prompt = ENTITY_PROMPT_TEMPLATE.format(text=text[:3000])
             
             response = self.groq_client.chat.completions.create(
-                model=os.getenv('DEFAULT_MODEL', 'llama-3.3-70b-versatile'),
+                model=DEFAULT_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=2000,
-                temperature=0.1
+                temperature=0.1,
+                response_format={"type": "json_object"}
             )
             
-            content = response.choices[0].message.content.strip()
-            
-            # Extract JSON from response
-            json_match = re.search(r'\[.*\]', content, re.DOTALL)
-            if json_match:
-                entities = json.loads(json_match.group())
-                return entities
-            
-            return []
+            # JSON mode guarantees a parseable object, no need to scan for brackets
+            entities = json.loads(response.choices[0].message.content).get('entities', [])
+            return entities if isinstance(entities, list) else []
             
         except Exception as e:
             logger.error(f"Error extracting entities with Groq: {e}")
@@ -338,22 +461,21 @@ class DocumentProcessor:
         """Fallback entity extraction using pattern matching"""
         entities = []
         
-        # Simple patterns for NASA-related entities
-        patterns = {
-            'Space Mission': r'\b[A-Z][a-z]+-\d+\b|\bISS\b|\bInternational Space Station\b',
-            'Organism': r'\b[A-Z][a-z]+ [a-z]+\b(?=.*(?:mouse|mice|rat|cell|organism))',
-            'Chemical': r'\b[A-Z][a-zA-Z]*\d+\b|\b[A-Z]{2,}\b',
-            'Equipment': r'\bmicroscop[ey]\b|\bspectromet[ery]\b|\bchamber\b|\bbioreactor\b'
-        }
-        
-        for entity_type, pattern in patterns.items():
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for match in matches[:5]:  # Limit to 5 per type
+        for entity_type, pattern in ENTITY_PATTERNS:
+            # Stop scanning once 5 distinct matches are found instead of matching the whole text
+            seen = set()
+            for match in pattern.finditer(text):
+                name = match.group()
+                if name in seen:
+                    continue
+                seen.add(name)
                 entities.append({
-                    'name': match,
+                    'name': name,
                     'type': entity_type,
                     'description': f"{entity_type} mentioned in NASA research"
                 })
+                if len(seen) >= 5:  # Limit to 5 per type
+                    break
         
         return entities
     
@@ -365,48 +487,43 @@ class DocumentProcessor:
             
             entity_names = [e['name'] for e in entities]
             
-            prompt = f"""
-            Given these entities found in a NASA research document: {', '.join(entity_names)}
-            
-            Identify relationships between these entities based on the following text.
-            Return relationships as JSON in this format:
-            [
-                {{
-                    "source": "entity1",
-                    "target": "entity2",
-                    "relationship": "relationship_type",
-                    "description": "brief description of the relationship"
-                }}
-            ]
-            
-            Common relationship types for NASA research:
-            - studies, analyzes, affects, influences, contains, produces, uses, involves, measures
-            
-            Text:
-            {text[:2000]}
-            """
+            prompt = RELATIONSHIP_PROMPT_TEMPLATE.format(entity_names=', '.join(entity_names), text=text[:2000])
             
             response = self.groq_client.chat.completions.create(
-                model=os.getenv('DEFAULT_MODEL', 'llama-3.3-70b-versatile'),
+                model=DEFAULT_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 max_tokens=1500,
-                temperature=0.1
+                temperature=0.1,
+                response_format={"type": "json_object"}
             )
             
-            content = response.choices[0].message.content.strip()
-            
-            # Extract JSON from response
-            json_match = re.search(r'\[.*\]', content, re.DOTALL)
-            if json_match:
-                relationships = json.loads(json_match.group())
-                return relationships
-            
-            return []
+            # JSON mode guarantees a parseable object, no need to scan for brackets
+            relationships = json.loads(response.choices[0].message.content).get('relationships', [])
+            return relationships if isinstance(relationships, list) else []
             
         except Exception as e:
             logger.error(f"Error extracting relationships: {e}")
             return []
     
+    def analyze_document(self, content: str, summarize: bool = True, embed: bool = True,
+                         extract_entities: bool = True) -> Dict[str, Any]:
+        """Run the independent Groq and Gemini calls for a document concurrently"""
+        # Each call is network-bound and handles its own errors, so threads overlap the waits
+        tasks = {}
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            if summarize:
+                tasks['summary'] = executor.submit(self.summarize_document, content)
+            if embed:
+                tasks['embedding'] = executor.submit(self.generate_embeddings, content)
+            if extract_entities:
+                tasks['entities'] = executor.submit(self.extract_entities, content)
+        
+        return {
+            'summary': tasks['summary'].result() if 'summary' in tasks else "",
+            'embedding': tasks['embedding'].result() if 'embedding' in tasks else None,
+            'entities': (tasks['entities'].result() or []) if 'entities' in tasks else []
+        }
+    
     def process_file(self, file_path: str, filename: str) -> Dict[str, Any]:
         """Process a file and return structured data"""
         try:
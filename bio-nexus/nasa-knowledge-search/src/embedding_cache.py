@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict
+
+logger = logging.getLogger(__name__)
+
+# Seconds to skip the persistent tier after a database error, doubling per consecutive failure
+PERSISTENCE_RETRY_DELAY = 5.0
+PERSISTENCE_MAX_RETRY_DELAY = 300.0
+
+class EmbeddingCache:
+    """Two-tier embedding cache: an in-process LRU backed by the embedding_cache table"""
+    
+    def __init__(self, model: str, maxsize: int = 10000):
+        self.model = model
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_manager = None
+        self._retry_delay = PERSISTENCE_RETRY_DELAY
+        self._retry_at = 0.0
+    
+    def key(self, text: str) -> bytes:
+        """Content hash for a text, scoped to the embedding model"""
+        return hashlib.blake2b(f"{self.model}\x00{text}".encode(), digest_size=16).digest()
+    
+    def get_many(self, keys: List[bytes], persistent: bool = True) -> Dict[bytes, List[float]]:
+        """Look up embeddings, checking memory first and then Postgres in one query
+        
+        Pass persistent=False on latency-sensitive paths to skip the Postgres round-trip.
+        """
+        hits = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    hits[key] = self._entries[key]
+        
+        misses = [key for key in keys if key not in hits]
+        if misses and persistent:
+            stored = self._load(misses)
+            self._remember(stored)
+            hits.update(stored)
+        return hits
+    
+    def put_many(self, embeddings: Dict[bytes, List[float]], persistent: bool = True):
+        """Store new embeddings in memory and, unless persistent=False, in Postgres"""
+        if not embeddings:
+            return
+        self._remember(embeddings)
+        if persistent:
+            self._store(embeddings)
+    
+    def _remember(self, embeddings: Dict[bytes, List[float]]):
+        """Add embeddings to the in-process LRU, evicting the oldest entries"""
+        with self._lock:
+            for key, embedding in embeddings.items():
+                self._entries[key] = embedding
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def _get_db_manager(self):
+        """Resolve the database manager on first use"""
+        if self._db_manager is None:
+            from src.database import get_database_manager
+            self._db_manager = get_database_manager()
+        return self._db_manager
+    
+    def _load(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        """Fetch embeddings from the persistent tier"""
+        if not self._persistence_available():
+            return {}
+        try:
+            stored = self._get_db_manager().get_cached_embeddings(keys)
+        except Exception as e:
+            self._back_off(e)
+            return {}
+        self._retry_delay = PERSISTENCE_RETRY_DELAY
+        return stored
+    
+    def _store(self, embeddings: Dict[bytes, List[float]]):
+        """Write embeddings to the persistent tier"""
+        if not self._persistence_available():
+            return
+        try:
+            self._get_db_manager().store_cached_embeddings(embeddings)
+        except Exception as e:
+            self._back_off(e)
+            return
+        self._retry_delay = PERSISTENCE_RETRY_DELAY
+    
+    def _persistence_available(self) -> bool:
+        """Whether the persistent tier is outside its post-error cooldown"""
+        return time.monotonic() >= self._retry_at
+    
+    def _back_off(self, error: Exception):
+        """Cache in memory only for a while after a database error, backing off on repeats"""
+        with self._lock:
+            delay = self._retry_delay
+            self._retry_at = time.monotonic() + delay
+            self._retry_delay = min(delay * 2, PERSISTENCE_MAX_RETRY_DELAY)
+        logger.warning(f"Embedding cache table unavailable, caching in memory only for {delay:.0f}s: {error}")
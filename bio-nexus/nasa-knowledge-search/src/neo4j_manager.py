@@ -1,43 +1,201 @@
 from neo4j import GraphDatabase
 import os
+import re
+import time
 import logging
-from typing import List, Dict, Any, Optional
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterator
 import streamlit as st
 
 logger = logging.getLogger(__name__)
 
+ENTITY_FULLTEXT_INDEX = 'entitySearch'
+
+# Graph indexes created on connect; IF NOT EXISTS keeps them idempotent
+SCHEMA_QUERIES = [
+    "CREATE INDEX entity_id IF NOT EXISTS FOR (e:Entity) ON (e.id)",
+    "CREATE INDEX document_id IF NOT EXISTS FOR (d:Document) ON (d.id)",
+    "CREATE INDEX entity_type IF NOT EXISTS FOR (e:Entity) ON (e.entity_type)",
+    "CREATE INDEX entity_name_lower IF NOT EXISTS FOR (e:Entity) ON (e.name_lower)",
+    # Backfill the lowercased name on entities created before it was stored
+    "MATCH (e:Entity) WHERE e.name_lower IS NULL AND e.name IS NOT NULL SET e.name_lower = toLower(e.name)",
+    f"CREATE FULLTEXT INDEX {ENTITY_FULLTEXT_INDEX} IF NOT EXISTS FOR (e:Entity) ON EACH [e.name, e.description]"
+]
+
+# Entity fields returned to callers, as a Cypher map projection
+ENTITY_PROJECTION = "{.id, .name, .description, .entity_type}"
+
+# Graph context neighbours may be entities or documents (over MENTIONS), so keep both sets of fields
+NEIGHBOR_PROJECTION = "{.id, .name, .title, .filename, .description, .entity_type}"
+
+# Full-text scores are unbounded Lucene values; graph context relevance is the raw score scaled
+# against a fixed ceiling onto [0, MAX_GRAPH_RELEVANCE], the flat weight graph rows used to get,
+# so it compares with vector similarity rather than with the other graph hits
+FULLTEXT_SCORE_CEILING = 10.0
+MAX_GRAPH_RELEVANCE = 0.5
+
+# Longest path find_shortest_path will search for; variable-length bounds cannot be parameters
+MAX_PATH_DEPTH = 6
+
+# Read queries, built once at import so the server-side plan cache always hits
+FIND_ENTITIES_PREFIX_QUERY = f"""
+MATCH (e:Entity)
+WHERE e.name_lower STARTS WITH $name_lower
+RETURN e {ENTITY_PROJECTION} AS e
+LIMIT $limit
+"""
+
+FIND_ENTITIES_FULLTEXT_QUERY = f"""
+CALL db.index.fulltext.queryNodes($index, $search)
+YIELD node, score
+RETURN node {ENTITY_PROJECTION} AS e
+LIMIT $limit
+"""
+
+ENTITY_RELATIONSHIPS_QUERY = """
+MATCH (e:Entity {id: $entity_id})-[r]-(connected)
+RETURN properties(e) AS e, properties(r) AS r, properties(connected) AS connected
+"""
+
+ENTITIES_RELATIONSHIPS_QUERY = """
+UNWIND $entity_ids AS entity_id
+MATCH (e:Entity {id: entity_id})-[r]-(connected)
+RETURN properties(e) AS e, properties(r) AS r, properties(connected) AS connected
+"""
+
+SHORTEST_PATH_QUERY = f"""
+MATCH (e1:Entity {{id: $entity1_id}}), (e2:Entity {{id: $entity2_id}})
+MATCH path = shortestPath((e1)-[*..{MAX_PATH_DEPTH}]-(e2))
+RETURN path
+"""
+
+ENTITIES_BY_TYPE_QUERY = f"""
+MATCH (e:Entity)
+WHERE e.entity_type = $entity_type
+RETURN e {ENTITY_PROJECTION} AS e
+LIMIT $limit
+"""
+
+SEARCH_GRAPH_QUERY = f"""
+CALL db.index.fulltext.queryNodes($index, $query)
+YIELD node, score
+RETURN node {ENTITY_PROJECTION} AS e, 'entity' as result_type, score
+LIMIT $limit
+"""
+
+GRAPH_CONTEXT_QUERY = f"""
+CALL db.index.fulltext.queryNodes($index, $query)
+YIELD node AS e, score
+WITH e, score
+LIMIT $limit
+RETURN e {ENTITY_PROJECTION} AS e, score,
+       [(e)-[r]-(connected) | {{relationship: properties(r), target: connected {NEIGHBOR_PROJECTION}}}] AS neighbors
+"""
+
+RELATED_ENTITIES_QUERY = """
+MATCH (e:Entity {id: $entity_id})-[r]-(related)
+RETURN properties(related) AS related, type(r) as relationship_type
+LIMIT $limit
+"""
+
+RELATED_ENTITIES_FILTERED_QUERY = """
+MATCH (e:Entity {id: $entity_id})-[r]-(related)
+WHERE type(r) IN $relationship_types
+RETURN properties(related) AS related, type(r) as relationship_type
+LIMIT $limit
+"""
+
+# Seconds get_graph_statistics reuses its last result; dashboards call it on every render
+GRAPH_STATS_TTL = 300
+
+# Rows sent per UNWIND statement in the bulk writers
+BULK_BATCH_SIZE = 10000
+
+# Characters with special meaning in Lucene query syntax
+LUCENE_SPECIAL = re.compile(r'([+\-!(){}\[\]^"~*?:\\/]|&&|\|\|)')
+
+def _fulltext_query(text: str) -> str:
+    """Escape free text for db.index.fulltext.queryNodes"""
+    return LUCENE_SPECIAL.sub(r'\\\1', text.strip())
+
+def _label(entity_type: str) -> str:
+    """Node label for an entity type"""
+    return entity_type.replace(' ', '_')
+
+def _relationship_type(relationship_type: str) -> str:
+    """Relationship type name for a free-text relationship"""
+    return relationship_type.replace(' ', '_').upper()
+
+def _run_write(tx, query: str, params: Dict):
+    """Managed-transaction body for the bulk writers"""
+    tx.run(query, params).consume()
+
 class Neo4jManager:
     def __init__(self):
         self.uri = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
         self.user = os.getenv('NEO4J_USER', 'neo4j')
         self.password = os.getenv('NEO4J_PASSWORD', 'neo4j_password')
         self.driver = None
+        self._stats_cache = None  # (expires_at, stats)
         self._connect()
     
     def _connect(self):
         """Establish connection to Neo4j"""
         try:
-            self.driver = GraphDatabase.driver(self.uri, auth=(self.user, self.password))
+            self.driver = GraphDatabase.driver(
+                self.uri,
+                auth=(self.user, self.password),
+                max_connection_pool_size=int(os.getenv('NEO4J_MAX_POOL_SIZE', '50')),
+                connection_acquisition_timeout=float(os.getenv('NEO4J_ACQUISITION_TIMEOUT', '30')),
+                max_transaction_retry_time=float(os.getenv('NEO4J_MAX_RETRY_TIME', '15')),
+                # Records are pulled in batches as callers iterate instead of all at once
+                fetch_size=int(os.getenv('NEO4J_FETCH_SIZE', '1000'))
+            )
             # Test connection
             with self.driver.session() as session:
                 session.run("RETURN 1")
             logger.info("Successfully connected to Neo4j")
+            self._ensure_indexes()
         except Exception as e:
             logger.error(f"Failed to connect to Neo4j: {e}")
             self.driver = None
     
+    def _ensure_indexes(self):
+        """Create the graph indexes used by lookups and search, and backfill indexed properties"""
+        try:
+            with self.driver.session() as session:
+                for query in SCHEMA_QUERIES:
+                    session.run(query).consume()
+        except Exception as e:
+            logger.warning(f"Could not ensure Neo4j indexes: {e}")
+    
     def close(self):
         """Close the connection"""
         if self.driver:
             self.driver.close()
     
-    def create_document_node(self, document_data: Dict) -> bool:
+    @contextmanager
+    def session_scope(self):
+        """Open one session to share across several query methods"""
+        with self.driver.session() as session:
+            yield session
+    
+    @contextmanager
+    def _session(self, session=None):
+        """Reuse the caller's session if given, otherwise open a new one"""
+        if session is not None:
+            yield session
+        else:
+            with self.driver.session() as new_session:
+                yield new_session
+    
+    def create_document_node(self, document_data: Dict, session=None) -> bool:
         """Create a document node in the knowledge graph"""
         if not self.driver:
             return False
         
         try:
-            with self.driver.session() as session:
+            with self._session(session) as session:
                 query = """
                 CREATE (d:Document {
                     id: $id,
@@ -54,43 +212,50 @@ class Neo4jManager:
             logger.error(f"Error creating document node: {e}")
             return False
     
-    def create_entity_node(self, entity_data: Dict) -> bool:
+    def create_entity_node(self, entity_data: Dict, session=None) -> bool:
         """Create an entity node in the knowledge graph"""
         if not self.driver:
             return False
         
         try:
-            with self.driver.session() as session:
-                # Create node with dynamic label based on entity type
-                entity_type = entity_data.get('entity_type', 'Entity').replace(' ', '_')
-                query = f"""
-                CREATE (e:{entity_type}:Entity {{
+            with self._session(session) as session:
+                # Dynamic label based on entity type, passed as a parameter through APOC
+                query = """
+                CALL apoc.create.node([$label, 'Entity'], {
                     id: $id,
                     name: $name,
+                    name_lower: $name_lower,
                     description: $description,
                     entity_type: $entity_type
-                }})
+                }) YIELD node
+                RETURN node.id
                 """
-                session.run(query, entity_data)
+                session.run(query, {
+                    **entity_data,
+                    'label': _label(entity_data.get('entity_type', 'Entity')),
+                    'name_lower': entity_data['name'].lower()
+                })
                 return True
         except Exception as e:
             logger.error(f"Error creating entity node: {e}")
             return False
     
-    def create_relationship(self, source_id: str, target_id: str, relationship_type: str, properties: Dict = None) -> bool:
+    def create_relationship(self, source_id: str, target_id: str, relationship_type: str, properties: Dict = None, session=None) -> bool:
         """Create a relationship between two nodes"""
         if not self.driver:
             return False
         
         try:
-            with self.driver.session() as session:
+            with self._session(session) as session:
                 query = """
-                MATCH (s {id: $source_id}), (t {id: $target_id})
-                CREATE (s)-[r:""" + relationship_type.replace(' ', '_').upper() + """ $properties]->(t)
+                MATCH (s:Entity {id: $source_id}), (t:Entity {id: $target_id})
+                CALL apoc.create.relationship(s, $relationship_type, $properties, t) YIELD rel
+                RETURN type(rel)
                 """
                 session.run(query, {
                     'source_id': source_id,
                     'target_id': target_id,
+                    'relationship_type': _relationship_type(relationship_type),
                     'properties': properties or {}
                 })
                 return True
@@ -98,62 +263,167 @@ class Neo4jManager:
             logger.error(f"Error creating relationship: {e}")
             return False
     
-    def find_entities_by_name(self, name: str, limit: int = 10) -> List[Dict]:
-        """Find entities by name (fuzzy search)"""
+    def _write_batches(self, session, query: str, rows: List[Dict], params: Dict = None):
+        """Run an UNWIND $rows query in managed transactions of BULK_BATCH_SIZE rows"""
+        for start in range(0, len(rows), BULK_BATCH_SIZE):
+            session.execute_write(_run_write, query, {**(params or {}), 'rows': rows[start:start + BULK_BATCH_SIZE]})
+    
+    def create_entities_bulk(self, entities: List[Dict], session=None) -> bool:
+        """Create many entity nodes with a single UNWIND"""
         if not self.driver:
-            return []
+            return False
+        if not entities:
+            return True
         
         try:
-            with self.driver.session() as session:
+            rows = [{
+                'label': _label(entity.get('entity_type', 'Entity')),
+                'properties': {**entity, 'name_lower': entity['name'].lower()}
+            } for entity in entities]
+            with self._session(session) as session:
                 query = """
-                MATCH (e:Entity)
-                WHERE toLower(e.name) CONTAINS toLower($name)
-                RETURN e
-                LIMIT $limit
+                UNWIND $rows AS row
+                CALL apoc.create.node([row.label, 'Entity'], row.properties) YIELD node
+                RETURN count(node)
                 """
-                result = session.run(query, {'name': name, 'limit': limit})
-                return [dict(record['e']) for record in result]
+                self._write_batches(session, query, rows)
+                return True
+        except Exception as e:
+            logger.error(f"Error creating entity nodes: {e}")
+            return False
+    
+    def create_relationships_bulk(self, relationships: List[Dict], session=None) -> bool:
+        """Create many entity relationships with a single UNWIND
+        
+        Each row needs source_id, target_id and relationship_type, plus optional properties.
+        """
+        if not self.driver:
+            return False
+        if not relationships:
+            return True
+        
+        try:
+            rows = [{
+                'source_id': relationship['source_id'],
+                'target_id': relationship['target_id'],
+                'relationship_type': _relationship_type(relationship['relationship_type']),
+                'properties': relationship.get('properties') or {}
+            } for relationship in relationships]
+            
+            with self._session(session) as session:
+                query = """
+                UNWIND $rows AS row
+                MATCH (s:Entity {id: row.source_id}), (t:Entity {id: row.target_id})
+                CALL apoc.create.relationship(s, row.relationship_type, row.properties, t) YIELD rel
+                RETURN count(rel)
+                """
+                self._write_batches(session, query, rows)
+                return True
+        except Exception as e:
+            logger.error(f"Error creating relationships: {e}")
+            return False
+    
+    def create_document_entity_relationships_bulk(self, document_id: str, entity_ids: List[str],
+                                                  relationship_type: str = "MENTIONS", session=None) -> bool:
+        """Link a document to many entities in one UNWIND"""
+        if not self.driver:
+            return False
+        if not entity_ids:
+            return True
+        
+        try:
+            with self._session(session) as session:
+                query = """
+                MATCH (d:Document {id: $document_id})
+                UNWIND $rows AS entity_id
+                MATCH (e:Entity {id: entity_id})
+                CALL apoc.create.relationship(d, $relationship_type, {}, e) YIELD rel
+                RETURN count(rel)
+                """
+                self._write_batches(session, query, entity_ids, {
+                    'document_id': document_id,
+                    'relationship_type': relationship_type
+                })
+                return True
+        except Exception as e:
+            logger.error(f"Error creating document-entity relationships: {e}")
+            return False
+    
+    def find_entities_by_name(self, name: str, limit: int = 10, session=None) -> List[Dict]:
+        """Find entities by name (fuzzy search)"""
+        if not self.driver:
+            return []
+        
+        try:
+            with self._session(session) as session:
+                # Prefix matches come straight off the name_lower range index
+                result = session.run(FIND_ENTITIES_PREFIX_QUERY, {'name_lower': name.strip().lower(), 'limit': limit})
+                entities = [record['e'] for record in result]
+                if entities:
+                    return entities
+                
+                # Otherwise fall back to a full-text match on the name field
+                search_text = _fulltext_query(name)
+                if not search_text:
+                    return []
+                result = session.run(FIND_ENTITIES_FULLTEXT_QUERY, {
+                    'index': ENTITY_FULLTEXT_INDEX,
+                    'search': f"name:({search_text})",
+                    'limit': limit
+                })
+                return [record['e'] for record in result]
         except Exception as e:
             logger.error(f"Error finding entities: {e}")
             return []
     
-    def get_entity_relationships(self, entity_id: str) -> List[Dict]:
+    def get_entity_relationships(self, entity_id: str, session=None) -> List[Dict]:
         """Get all relationships for an entity"""
         if not self.driver:
             return []
         
         try:
-            with self.driver.session() as session:
-                query = """
-                MATCH (e {id: $entity_id})-[r]-(connected)
-                RETURN e, r, connected
-                """
-                result = session.run(query, {'entity_id': entity_id})
+            with self._session(session) as session:
+                result = session.run(ENTITY_RELATIONSHIPS_QUERY, {'entity_id': entity_id})
                 relationships = []
                 for record in result:
                     relationships.append({
-                        'source': dict(record['e']),
-                        'relationship': dict(record['r']),
-                        'target': dict(record['connected'])
+                        'source': record['e'],
+                        'relationship': record['r'],
+                        'target': record['connected']
                     })
                 return relationships
         except Exception as e:
             logger.error(f"Error getting entity relationships: {e}")
             return []
     
-    def find_shortest_path(self, entity1_id: str, entity2_id: str) -> List[Dict]:
+    def get_relationships_for_entities(self, entity_ids: List[str], session=None) -> List[Dict]:
+        """Get all relationships for several entities in one query"""
+        return list(self.iter_relationships_for_entities(entity_ids, session=session))
+    
+    def iter_relationships_for_entities(self, entity_ids: List[str], session=None) -> Iterator[Dict]:
+        """Lazily yield relationships for several entities, fetching records in batches"""
+        if not self.driver or not entity_ids:
+            return
+        
+        try:
+            with self._session(session) as session:
+                for record in session.run(ENTITIES_RELATIONSHIPS_QUERY, {'entity_ids': entity_ids}):
+                    yield {
+                        'source': record['e'],
+                        'relationship': record['r'],
+                        'target': record['connected']
+                    }
+        except Exception as e:
+            logger.error(f"Error getting relationships for entities: {e}")
+    
+    def find_shortest_path(self, entity1_id: str, entity2_id: str, session=None) -> List[Dict]:
         """Find the shortest path between two entities"""
         if not self.driver:
             return []
         
         try:
-            with self.driver.session() as session:
-                query = """
-                MATCH (e1 {id: $entity1_id}), (e2 {id: $entity2_id})
-                MATCH path = shortestPath((e1)-[*]-(e2))
-                RETURN path
-                """
-                result = session.run(query, {
+            with self._session(session) as session:
+                result = session.run(SHORTEST_PATH_QUERY, {
                     'entity1_id': entity1_id,
                     'entity2_id': entity2_id
                 })
@@ -170,32 +440,28 @@ class Neo4jManager:
             logger.error(f"Error finding shortest path: {e}")
             return []
     
-    def get_related_entities(self, entity_id: str, relationship_types: List[str] = None, limit: int = 10) -> List[Dict]:
+    def get_related_entities(self, entity_id: str, relationship_types: List[str] = None, limit: int = 10, session=None) -> List[Dict]:
         """Get entities related to a given entity"""
         if not self.driver:
             return []
         
         try:
-            with self.driver.session() as session:
+            with self._session(session) as session:
+                # The type filter is a list parameter, so every call shares one plan
                 if relationship_types:
-                    rel_filter = "|".join([f":{rel_type}" for rel_type in relationship_types])
-                    query = f"""
-                    MATCH (e {{id: $entity_id}})-[r{rel_filter}]-(related)
-                    RETURN related, type(r) as relationship_type
-                    LIMIT $limit
-                    """
+                    query = RELATED_ENTITIES_FILTERED_QUERY
                 else:
-                    query = """
-                    MATCH (e {id: $entity_id})-[r]-(related)
-                    RETURN related, type(r) as relationship_type
-                    LIMIT $limit
-                    """
+                    query = RELATED_ENTITIES_QUERY
                 
-                result = session.run(query, {'entity_id': entity_id, 'limit': limit})
+                result = session.run(query, {
+                    'entity_id': entity_id,
+                    'relationship_types': relationship_types or [],
+                    'limit': limit
+                })
                 related_entities = []
                 for record in result:
                     related_entities.append({
-                        'entity': dict(record['related']),
+                        'entity': record['related'],
                         'relationship_type': record['relationship_type']
                     })
                 return related_entities
@@ -203,41 +469,38 @@ class Neo4jManager:
             logger.error(f"Error getting related entities: {e}")
             return []
     
-    def search_entities_by_type(self, entity_type: str, limit: int = 50) -> List[Dict]:
+    def search_entities_by_type(self, entity_type: str, limit: int = 50, session=None) -> List[Dict]:
         """Search entities by type"""
         if not self.driver:
             return []
         
         try:
-            with self.driver.session() as session:
-                query = """
-                MATCH (e:Entity)
-                WHERE e.entity_type = $entity_type
-                RETURN e
-                LIMIT $limit
-                """
-                result = session.run(query, {'entity_type': entity_type, 'limit': limit})
-                return [dict(record['e']) for record in result]
+            with self._session(session) as session:
+                result = session.run(ENTITIES_BY_TYPE_QUERY, {'entity_type': entity_type, 'limit': limit})
+                return [record['e'] for record in result]
         except Exception as e:
             logger.error(f"Error searching entities by type: {e}")
             return []
     
-    def get_graph_statistics(self) -> Dict:
-        """Get statistics about the knowledge graph"""
+    def get_graph_statistics(self, session=None) -> Dict:
+        """Get statistics about the knowledge graph, cached for GRAPH_STATS_TTL seconds"""
         if not self.driver:
             return {}
         
+        if self._stats_cache and self._stats_cache[0] > time.monotonic():
+            return self._stats_cache[1]
+        
         try:
-            with self.driver.session() as session:
+            with self._session(session) as session:
                 stats = {}
                 
-                # Count nodes
-                result = session.run("MATCH (n) RETURN count(n) as node_count")
-                stats['total_nodes'] = result.single()['node_count']
-                
-                # Count relationships
-                result = session.run("MATCH ()-[r]->() RETURN count(r) as rel_count")
-                stats['total_relationships'] = result.single()['rel_count']
+                # Node, relationship and per-type counts from the store's maintained counters
+                counters = session.run("""
+                CALL apoc.meta.stats() YIELD nodeCount, relCount, relTypesCount
+                RETURN nodeCount, relCount, relTypesCount
+                """).single()
+                stats['total_nodes'] = counters['nodeCount']
+                stats['total_relationships'] = counters['relCount']
                 
                 # Count by entity type
                 result = session.run("""
@@ -248,41 +511,43 @@ class Neo4jManager:
                 stats['entity_types'] = [dict(record) for record in result]
                 
                 # Count by relationship type
-                result = session.run("""
-                MATCH ()-[r]->()
-                RETURN type(r) as relationship_type, count(r) as count
-                ORDER BY count DESC
-                """)
-                stats['relationship_types'] = [dict(record) for record in result]
+                stats['relationship_types'] = sorted(
+                    ({'relationship_type': rel_type, 'count': count}
+                     for rel_type, count in counters['relTypesCount'].items()),
+                    key=lambda item: item['count'],
+                    reverse=True
+                )
                 
+                self._stats_cache = (time.monotonic() + GRAPH_STATS_TTL, stats)
                 return stats
         except Exception as e:
             logger.error(f"Error getting graph statistics: {e}")
             return {}
     
-    def search_graph(self, query_text: str, limit: int = 20) -> List[Dict]:
+    def search_graph(self, query_text: str, limit: int = 20, session=None) -> List[Dict]:
         """Search the entire graph for entities and relationships matching the query"""
         if not self.driver:
             return []
         
         try:
-            with self.driver.session() as session:
-                # Search entities by name and description
-                entity_query = """
-                MATCH (e:Entity)
-                WHERE toLower(e.name) CONTAINS toLower($query)
-                   OR toLower(e.description) CONTAINS toLower($query)
-                RETURN e, 'entity' as result_type
-                LIMIT $limit
-                """
+            with self._session(session) as session:
+                search_text = _fulltext_query(query_text)
+                if not search_text:
+                    return []
                 
-                result = session.run(entity_query, {'query': query_text, 'limit': limit})
+                # Search entities by name and description through the full-text index
+                result = session.run(SEARCH_GRAPH_QUERY, {
+                    'index': ENTITY_FULLTEXT_INDEX,
+                    'query': search_text,
+                    'limit': limit
+                })
                 search_results = []
                 
                 for record in result:
                     search_results.append({
-                        'data': dict(record['e']),
-                        'type': record['result_type']
+                        'data': record['e'],
+                        'type': record['result_type'],
+                        'score': record['score']
                     })
                 
                 return search_results
@@ -290,20 +555,54 @@ class Neo4jManager:
             logger.error(f"Error searching graph: {e}")
             return []
     
-    def create_document_entity_relationship(self, document_id: str, entity_id: str, relationship_type: str = "MENTIONS") -> bool:
+    def iter_graph_context(self, query_text: str, limit: int = 20, session=None) -> Iterator[Dict]:
+        """Yield relationships around entities matching the query, found and expanded in one query
+        
+        Each item carries the matched entity's full-text score scaled to [0, MAX_GRAPH_RELEVANCE].
+        """
+        if not self.driver:
+            return
+        
+        search_text = _fulltext_query(query_text)
+        if not search_text:
+            return
+        
+        try:
+            with self._session(session) as session:
+                result = session.run(GRAPH_CONTEXT_QUERY, {
+                    'index': ENTITY_FULLTEXT_INDEX,
+                    'query': search_text,
+                    'limit': limit
+                })
+                
+                for record in result:
+                    score = MAX_GRAPH_RELEVANCE * min((record['score'] or 0) / FULLTEXT_SCORE_CEILING, 1.0)
+                    for neighbor in record['neighbors']:
+                        yield {
+                            'source': record['e'],
+                            'relationship': neighbor['relationship'],
+                            'target': neighbor['target'],
+                            'score': score
+                        }
+        except Exception as e:
+            logger.error(f"Error searching graph context: {e}")
+    
+    def create_document_entity_relationship(self, document_id: str, entity_id: str, relationship_type: str = "MENTIONS", session=None) -> bool:
         """Create a relationship between a document and an entity"""
         if not self.driver:
             return False
         
         try:
-            with self.driver.session() as session:
-                query = f"""
-                MATCH (d:Document {{id: $document_id}}), (e:Entity {{id: $entity_id}})
-                CREATE (d)-[r:{relationship_type}]->(e)
+            with self._session(session) as session:
+                query = """
+                MATCH (d:Document {id: $document_id}), (e:Entity {id: $entity_id})
+                CALL apoc.create.relationship(d, $relationship_type, {}, e) YIELD rel
+                RETURN type(rel)
                 """
                 session.run(query, {
                     'document_id': document_id,
-                    'entity_id': entity_id
+                    'entity_id': entity_id,
+                    'relationship_type': relationship_type
                 })
                 return True
         except Exception as e:
@@ -1,6 +1,10 @@
 import os
+import heapq
 import logging
-from typing import List, Dict, Any, Optional, Tuple
+from itertools import islice
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import numpy as np
 from src.database import get_database_manager
 from src.neo4j_manager import get_neo4j_manager
@@ -10,6 +14,22 @@ import streamlit as st
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on relationships handed to the agents as knowledge graph context
+MAX_KG_RELATIONSHIPS = 100
+
+# Graph rows kept by _combine_search_results; vector hits are already bounded by their search limits
+KG_RESULTS_TOP_K = 30
+
+# Answer returned without calling the agents when no search backend found anything
+EMPTY_ANSWER = {
+    'answer': "I couldn't find any documents or knowledge graph entries related to your question. "
+              "Try rephrasing it or uploading more documents.",
+    'sources': [],
+    'follow_up_questions': [],
+    'query_type': 'no_results',
+    'confidence': 0.0
+}
+
 class RAGSystem:
     def __init__(self):
         self.db_manager = get_database_manager()
@@ -18,69 +38,57 @@ class RAGSystem:
         self.agents = get_nasa_agents()
         self.similarity_threshold = 0.7
     
-    def search_documents(self, query: str, limit: int = 10) -> List[Dict]:
+    def _embed(self, query: str) -> Optional[List[float]]:
+        """Embed a query; repeats are served by the processor's content-hash embedding cache"""
+        return self.doc_processor.generate_embeddings(query)
+    
+    def search_documents(self, query: str, limit: int = 10,
+                         query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Search for relevant documents using vector similarity"""
         try:
-            # Generate query embedding
-            query_embedding = self.doc_processor.generate_embeddings(query)
+            # Generate query embedding unless the caller already has one
+            if query_embedding is None:
+                query_embedding = self._embed(query)
             if not query_embedding:
                 return []
             
-            # Search similar documents
-            similar_docs = self.db_manager.search_similar_documents(query_embedding, limit)
-            
-            # Filter by similarity threshold
-            filtered_docs = [
-                doc for doc in similar_docs 
-                if doc.get('similarity', 0) >= self.similarity_threshold
-            ]
-            
-            return filtered_docs
+            # Search similar documents above the similarity threshold
+            return self.db_manager.search_similar_documents(
+                query_embedding, limit, self.similarity_threshold
+            )
             
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
             return []
     
-    def search_chunks(self, query: str, limit: int = 20) -> List[Dict]:
+    def search_chunks(self, query: str, limit: int = 20,
+                      query_embedding: Optional[List[float]] = None) -> List[Dict]:
         """Search for relevant document chunks using vector similarity"""
         try:
-            # Generate query embedding
-            query_embedding = self.doc_processor.generate_embeddings(query)
+            # Generate query embedding unless the caller already has one
+            if query_embedding is None:
+                query_embedding = self._embed(query)
             if not query_embedding:
                 return []
             
-            # Search similar chunks
-            similar_chunks = self.db_manager.search_similar_chunks(query_embedding, limit)
-            
-            # Filter by similarity threshold
-            filtered_chunks = [
-                chunk for chunk in similar_chunks 
-                if chunk.get('similarity', 0) >= self.similarity_threshold
-            ]
-            
-            return filtered_chunks
+            # Search similar chunks above the similarity threshold
+            return self.db_manager.search_similar_chunks(
+                query_embedding, limit, self.similarity_threshold
+            )
             
         except Exception as e:
             logger.error(f"Error searching chunks: {e}")
             return []
     
-    def search_knowledge_graph(self, query: str) -> List[Dict]:
+    def search_knowledge_graph(self, query: str, session=None) -> List[Dict]:
         """Search the knowledge graph for relevant entities and relationships"""
         try:
             if not self.neo4j_manager.driver:
                 return []
             
-            # Search for entities matching the query
-            entities = self.neo4j_manager.search_graph(query, limit=20)
-            
-            # Get relationships for found entities
-            kg_context = []
-            for entity in entities:
-                if entity['type'] == 'entity':
-                    entity_id = entity['data'].get('id')
-                    if entity_id:
-                        relationships = self.neo4j_manager.get_entity_relationships(entity_id)
-                        kg_context.extend(relationships)
+            # Find matching entities and their neighbourhoods in one query
+            relationships = self.neo4j_manager.iter_graph_context(query, limit=20, session=session)
+            kg_context = list(islice(relationships, MAX_KG_RELATIONSHIPS))
             
             return kg_context
             
@@ -88,17 +96,32 @@ class RAGSystem:
             logger.error(f"Error searching knowledge graph: {e}")
             return []
     
+    def _search_knowledge_graph_in_session(self, query: str) -> List[Dict]:
+        """Search the knowledge graph in a dedicated session, since sessions are not thread-safe"""
+        with self.neo4j_manager.session_scope() as session:
+            return self.search_knowledge_graph(query, session=session)
+    
     def hybrid_search(self, query: str, include_kg: bool = True) -> Dict[str, Any]:
         """Perform hybrid search combining document similarity and knowledge graph"""
         try:
-            # Search documents and chunks
-            relevant_docs = self.search_documents(query, limit=10)
-            relevant_chunks = self.search_chunks(query, limit=20)
-            
-            # Search knowledge graph if enabled
-            kg_context = []
-            if include_kg:
-                kg_context = self.search_knowledge_graph(query)
+            # The three searches are independent I/O, so run them concurrently
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                # Knowledge graph search does not need the embedding; start it first
+                kg_future = None
+                if include_kg and self.neo4j_manager.driver:
+                    kg_future = executor.submit(self._search_knowledge_graph_in_session, query)
+                
+                # Embed the query once for both document and chunk search; if embedding
+                # fails, skip vector search rather than letting each search embed again
+                query_embedding = self._embed(query)
+                relevant_docs, relevant_chunks = [], []
+                if query_embedding:
+                    docs_future = executor.submit(self.search_documents, query, 10, query_embedding)
+                    chunks_future = executor.submit(self.search_chunks, query, 20, query_embedding)
+                    relevant_docs = docs_future.result()
+                    relevant_chunks = chunks_future.result()
+                
+                kg_context = kg_future.result() if kg_future else []
             
             # Combine and rank results
             combined_results = self._combine_search_results(
@@ -124,48 +147,64 @@ class RAGSystem:
                 'error': str(e)
             }
     
-    def _combine_search_results(self, docs: List[Dict], chunks: List[Dict], 
-                               kg_context: List[Dict], query: str) -> List[Dict]:
-        """Combine and rank search results from different sources"""
-        combined = []
-        
-        # Add document results
+    def _iter_candidates(self, docs: List[Dict], chunks: List[Dict], kg_context: List[Dict],
+                         kg_top_k: int) -> Iterator[Tuple[float, str, Dict]]:
+        """Yield (score, type, item) for every vector hit and the kg_top_k best graph rows"""
         for doc in docs:
-            combined.append({
-                'type': 'document',
-                'source': 'vector_search',
-                'data': doc,
-                'relevance_score': doc.get('similarity', 0),
-                'title': doc.get('title', doc.get('filename', 'Unknown'))
-            })
-        
-        # Add chunk results
+            yield doc.get('similarity', 0), 'document', doc
         for chunk in chunks:
-            combined.append({
-                'type': 'chunk',
-                'source': 'vector_search',
-                'data': chunk,
-                'relevance_score': chunk.get('similarity', 0),
-                'title': f"{chunk.get('filename', 'Unknown')} (chunk {chunk.get('chunk_index', 0)})"
-            })
+            yield chunk.get('similarity', 0), 'chunk', chunk
+        # Scaled full-text match score, capped at the 0.5 default for unscored items
+        kg_candidates = ((kg_item.get('score', 0.5), 'knowledge_graph', kg_item) for kg_item in kg_context)
+        yield from heapq.nlargest(kg_top_k, kg_candidates, key=itemgetter(0))
+    
+    def _combine_search_results(self, docs: List[Dict], chunks: List[Dict], 
+                               kg_context: List[Dict], query: str,
+                               kg_top_k: int = KG_RESULTS_TOP_K) -> List[Dict]:
+        """Combine and rank search results from different sources"""
+        # Only graph rows are cut, so high-scoring graph rows can never crowd out document text
+        ranked = sorted(self._iter_candidates(docs, chunks, kg_context, kg_top_k),
+                        key=itemgetter(0), reverse=True)
         
-        # Add knowledge graph results
-        for kg_item in kg_context:
+        combined = []
+        for score, result_type, item in ranked:
+            if result_type == 'document':
+                source = 'vector_search'
+                title = item.get('title', item.get('filename', 'Unknown'))
+            elif result_type == 'chunk':
+                source = 'vector_search'
+                title = f"{item.get('filename', 'Unknown')} (chunk {item.get('chunk_index', 0)})"
+            else:
+                source = 'graph_search'
+                title = f"KG: {item.get('source', {}).get('name', 'Unknown relationship')}"
+            
             combined.append({
-                'type': 'knowledge_graph',
-                'source': 'graph_search',
-                'data': kg_item,
-                'relevance_score': 0.5,  # Default score for KG items
-                'title': f"KG: {kg_item.get('source', {}).get('name', 'Unknown relationship')}"
+                'type': result_type,
+                'source': source,
+                'data': item,
+                'relevance_score': score,
+                'title': title
             })
         
-        # Sort by relevance score
-        combined.sort(key=lambda x: x['relevance_score'], reverse=True)
-        
         return combined
     
     def generate_answer(self, query: str, search_results: Dict[str, Any]) -> Dict[str, Any]:
         """Generate an answer using the multi-agent system"""
+        # A failed search is not the same as finding nothing; report it
+        if search_results.get('error'):
+            return {
+                'answer': f"I'm sorry, I encountered an error while searching: {search_results['error']}",
+                'sources': [],
+                'follow_up_questions': [],
+                'query_type': 'error',
+                'confidence': 0.0
+            }
+        
+        if not (search_results.get('documents') or search_results.get('chunks')
+                or search_results.get('knowledge_graph')):
+            # Fresh lists so callers can't mutate the shared constant
+            return dict(EMPTY_ANSWER, sources=[], follow_up_questions=[])
+        
         try:
             # Classify the query
             search_query = self.agents.classify_query(query)
@@ -210,31 +249,44 @@ class RAGSystem:
             }
     
     def _extract_sources(self, search_results: Dict[str, Any]) -> List[Dict]:
-        """Extract source information from search results"""
-        sources = []
+        """Extract source information from search results, most relevant first and without duplicates"""
+        # Built from the vector hits themselves so graph rows can never crowd sources out;
+        # each list arrives ordered by similarity, so merging them keeps the overall ranking
+        ranked = heapq.merge(
+            (('document', doc) for doc in search_results.get('documents', [])),
+            (('chunk', chunk) for chunk in search_results.get('chunks', [])),
+            key=lambda result: result[1].get('similarity', 0),
+            reverse=True
+        )
         
-        # Extract from documents
-        for doc in search_results.get('documents', []):
-            sources.append({
-                'type': 'document',
-                'title': doc.get('title', doc.get('filename', 'Unknown')),
-                'filename': doc.get('filename', 'Unknown'),
-                'similarity': doc.get('similarity', 0),
-                'id': doc.get('id')
-            })
-        
-        # Extract from chunks
-        for chunk in search_results.get('chunks', []):
-            sources.append({
-                'type': 'chunk',
-                'title': chunk.get('title', chunk.get('filename', 'Unknown')),
-                'filename': chunk.get('filename', 'Unknown'),
-                'chunk_index': chunk.get('chunk_index', 0),
-                'similarity': chunk.get('similarity', 0),
-                'id': chunk.get('id')
-            })
+        sources = {}
+        for result_type, item in ranked:
+            if result_type == 'document':
+                source = {
+                    'type': 'document',
+                    'title': item.get('title', item.get('filename', 'Unknown')),
+                    'filename': item.get('filename', 'Unknown'),
+                    'similarity': item.get('similarity', 0),
+                    'id': item.get('id')
+                }
+                document_key = item.get('id') or item.get('filename')
+            else:
+                source = {
+                    'type': 'chunk',
+                    'title': item.get('title', item.get('filename', 'Unknown')),
+                    'filename': item.get('filename', 'Unknown'),
+                    'chunk_index': item.get('chunk_index', 0),
+                    'similarity': item.get('similarity', 0),
+                    'id': item.get('id')
+                }
+                document_key = item.get('document_id') or item.get('filename')
+            
+            # Cite each document once, through whichever of its hits ranks highest
+            sources.setdefault(str(document_key), source)
+            if len(sources) >= 10:  # Limit to top 10 sources
+                break
         
-        return sources[:10]  # Limit to top 10 sources
+        return list(sources.values())
     
     def _calculate_confidence(self, search_results: Dict[str, Any]) -> float:
         """Calculate confidence score based on search results quality"""
@@ -245,19 +297,17 @@ class RAGSystem:
             if not docs and not chunks:
                 return 0.0
             
-            # Calculate average similarity scores
-            doc_similarities = [doc.get('similarity', 0) for doc in docs]
-            chunk_similarities = [chunk.get('similarity', 0) for chunk in chunks]
-            
-            all_similarities = doc_similarities + chunk_similarities
-            
-            if not all_similarities:
-                return 0.0
+            # Calculate average similarity scores in a single array pass
+            similarities = np.fromiter(
+                (result.get('similarity', 0) for result in docs + chunks),
+                dtype=np.float64,
+                count=len(docs) + len(chunks)
+            )
             
-            avg_similarity = sum(all_similarities) / len(all_similarities)
+            avg_similarity = float(similarities.mean())
             
             # Boost confidence if we have multiple good sources
-            num_good_sources = len([s for s in all_similarities if s > 0.8])
+            num_good_sources = int(np.count_nonzero(similarities > 0.8))
             source_bonus = min(num_good_sources * 0.1, 0.3)
             
             confidence = min(avg_similarity + source_bonus, 1.0)
@@ -295,6 +345,7 @@ class RAGSystem:
                 'confidence': answer_data['confidence'],
                 'query_type': answer_data['query_type'],
                 'num_sources': len(answer_data['sources']),
+                'related_topics': self.get_related_topics(query, search_results),
                 'search_results': search_results
             }
             
@@ -308,22 +359,28 @@ class RAGSystem:
                 'confidence': 0.0,
                 'query_type': 'error',
                 'num_sources': 0,
+                'related_topics': [],
                 'search_results': {}
             }
     
-    def get_related_topics(self, query: str, limit: int = 5) -> List[str]:
+    def get_related_topics(self, query: str, search_results: Dict[str, Any] = None,
+                           limit: int = 5) -> List[str]:
         """Get related topics based on knowledge graph exploration"""
         try:
-            # Search knowledge graph for related entities
-            kg_results = self.search_knowledge_graph(query)
+            # Reuse the graph context from hybrid_search when available
+            if search_results is not None:
+                kg_results = search_results.get('knowledge_graph', [])
+            else:
+                kg_results = self.search_knowledge_graph(query)
             
             related_topics = set()
             
             for item in kg_results:
-                if 'source' in item and 'name' in item['source']:
-                    related_topics.add(item['source']['name'])
-                if 'target' in item and 'name' in item['target']:
-                    related_topics.add(item['target']['name'])
+                # Document neighbours have no name; only keep non-empty names
+                for node in (item.get('source'), item.get('target')):
+                    name = (node or {}).get('name')
+                    if name:
+                        related_topics.add(name)
             
             return list(related_topics)[:limit]
             
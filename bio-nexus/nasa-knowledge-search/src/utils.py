@@ -3,15 +3,47 @@ Utility functions for the NASA Knowledge Search Engine
 """
 
 import os
+import re
 import logging
 import time
-from typing import Dict, List, Any, Optional
+import random
+from typing import Dict, List, Any, Optional, Union, BinaryIO
 import streamlit as st
 import hashlib
 import json
+from datetime import datetime, timezone
+from functools import lru_cache
 
 logger = logging.getLogger(__name__)
 
+# Read size when hashing file objects, so large uploads are never held in memory twice
+HASH_CHUNK_SIZE = 1 << 20
+
+# Characters stripped from each whitespace-separated word: everything but Unicode letters and digits
+NON_ALNUM_RE = re.compile(r"[\W_]+")
+
+# Common words skipped by extract_keywords
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 
+    'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
+    'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
+    'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those'
+})
+
+# Characters replaced with '_' by sanitize_filename
+UNSAFE_FILENAME_CHARS = str.maketrans({char: '_' for char in '/\\:*?"<>|'})
+
+# Units used by format_file_size
+SIZE_NAMES = ("B", "KB", "MB", "GB", "TB")
+
+# (upper bound in seconds, seconds per unit, unit) for time_ago, checked in order
+TIME_AGO_UNITS = (
+    (60, 1, 'second'),
+    (3600, 60, 'minute'),
+    (86400, 3600, 'hour'),
+    (None, 86400, 'day')
+)
+
 def setup_logging():
     """Setup logging configuration"""
     logging.basicConfig(
@@ -34,36 +66,39 @@ def check_api_keys() -> Dict[str, bool]:
     
     return status
 
-def get_file_hash(file_content: bytes) -> str:
-    """Generate MD5 hash for file content"""
-    return hashlib.md5(file_content).hexdigest()
+def get_file_hash(file_content: Union[bytes, bytearray, BinaryIO]) -> str:
+    """Generate SHA-256 hash for file content, streaming file objects in chunks"""
+    file_hash = hashlib.sha256()
+    if isinstance(file_content, (bytes, bytearray)):
+        file_hash.update(memoryview(file_content))
+    else:
+        for chunk in iter(lambda: file_content.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
 
 def format_file_size(size_bytes: int) -> str:
     """Format file size in human readable format"""
-    if size_bytes == 0:
+    if size_bytes <= 0:
         return "0 B"
     
-    size_names = ["B", "KB", "MB", "GB", "TB"]
-    i = 0
-    while size_bytes >= 1024 and i < len(size_names) - 1:
-        size_bytes /= 1024.0
-        i += 1
-    
-    return f"{size_bytes:.1f} {size_names[i]}"
+    # Each unit is 2**10 of the previous, so the bit length picks the unit directly
+    i = min((int(size_bytes).bit_length() - 1) // 10, len(SIZE_NAMES) - 1)
+    return f"{size_bytes / (1 << (10 * i)):.1f} {SIZE_NAMES[i]}"
+
+@lru_cache(maxsize=16)
+def _allowed_type_set(allowed_types: tuple) -> frozenset:
+    """Lowercased set of allowed extensions, built once per distinct list"""
+    return frozenset(t.lower() for t in allowed_types)
 
 def validate_file_type(filename: str, allowed_types: List[str]) -> bool:
     """Validate if file type is allowed"""
-    file_extension = filename.lower().split('.')[-1]
-    return file_extension in [t.lower() for t in allowed_types]
+    file_extension = os.path.splitext(filename)[1].lower().lstrip('.')
+    return file_extension in _allowed_type_set(tuple(allowed_types))
 
 def sanitize_filename(filename: str) -> str:
     """Sanitize filename for safe storage"""
-    # Remove or replace unsafe characters
-    unsafe_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
-    for char in unsafe_chars:
-        filename = filename.replace(char, '_')
-    
-    return filename
+    # Replace unsafe characters in a single pass
+    return filename.translate(UNSAFE_FILENAME_CHARS)
 
 def create_progress_tracker(total: int, description: str = "Processing"):
     """Create a progress tracker for long operations"""
@@ -92,28 +127,18 @@ def truncate_text(text: str, max_length: int = 100, suffix: str = "...") -> str:
 
 def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
     """Extract keywords from text (simple implementation)"""
-    # Remove common stop words
-    stop_words = {
-        'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 
-        'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being',
-        'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could',
-        'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those'
-    }
-    
-    # Simple keyword extraction
-    words = text.lower().split()
     keywords = []
+    seen = set()
     
-    for word in words:
-        # Clean word
-        word = ''.join(c for c in word if c.isalnum())
+    for word in text.lower().split():
+        # Clean word in one C-level pass
+        word = NON_ALNUM_RE.sub('', word)
         
-        # Filter keywords
-        if (len(word) > 3 and 
-            word not in stop_words and 
-            word not in keywords):
-            keywords.append(word)
+        if len(word) <= 3 or word in STOP_WORDS or word in seen:
+            continue
         
+        seen.add(word)
+        keywords.append(word)
         if len(keywords) >= max_keywords:
             break
     
@@ -122,51 +147,46 @@ def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
 def time_ago(timestamp: str) -> str:
     """Convert timestamp to human readable time ago format"""
     try:
-        from datetime import datetime
-        
-        # Parse timestamp
-        if isinstance(timestamp, str):
-            dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-        else:
-            dt = timestamp
-        
-        now = datetime.now()
-        diff = now - dt.replace(tzinfo=None)
+        # Parse timestamp; fromisoformat accepts a trailing 'Z' on Python 3.11+
+        dt = datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
         
-        seconds = diff.total_seconds()
+        # Compare aware timestamps in UTC and naive ones in local time
+        now = datetime.now(timezone.utc) if dt.tzinfo else datetime.now()
+        seconds = (now - dt).total_seconds()
         
-        if seconds < 60:
-            return "just now"
-        elif seconds < 3600:
-            minutes = int(seconds / 60)
-            return f"{minutes} minute{'s' if minutes != 1 else ''} ago"
-        elif seconds < 86400:
-            hours = int(seconds / 3600)
-            return f"{hours} hour{'s' if hours != 1 else ''} ago"
-        else:
-            days = int(seconds / 86400)
-            return f"{days} day{'s' if days != 1 else ''} ago"
+        for limit, divisor, unit in TIME_AGO_UNITS:
+            if limit is None or seconds < limit:
+                if unit == 'second':
+                    return "just now"
+                count = int(seconds / divisor)
+                return f"{count} {unit}{'s' if count != 1 else ''} ago"
     
     except Exception:
         return "unknown"
 
 def cache_key(*args) -> str:
     """Generate cache key from arguments"""
-    key_string = "_".join(str(arg) for arg in args)
-    return hashlib.md5(key_string.encode()).hexdigest()
+    # Non-cryptographic use; blake2b is faster than MD5 and each arg is fed without joining
+    key_hash = hashlib.blake2b(digest_size=16)
+    for arg in args:
+        key_hash.update(str(arg).encode())
+        key_hash.update(b"\x1f")
+    return key_hash.hexdigest()
 
-def retry_operation(operation, max_retries: int = 3, delay: float = 1.0):
-    """Retry operation with exponential backoff"""
+def retry_operation(operation, max_retries: int = 3, delay: float = 1.0, max_delay: float = 30.0):
+    """Retry operation with capped exponential backoff and jitter"""
     for attempt in range(max_retries):
         try:
             return operation()
         except Exception as e:
             if attempt == max_retries - 1:
-                raise e
+                raise
             
-            logger.warning(f"Operation failed (attempt {attempt + 1}), retrying in {delay}s: {e}")
-            time.sleep(delay)
-            delay *= 2  # Exponential backoff
+            # Jitter spreads out retries from callers that failed at the same time
+            sleep_for = min(delay * (1 + random.random()), max_delay)
+            logger.warning(f"Operation failed (attempt {attempt + 1}), retrying in {sleep_for:.1f}s: {e}")
+            time.sleep(sleep_for)
+            delay = min(delay * 2, max_delay)
     
     return None
 
@@ -216,22 +236,22 @@ class Timer:
     
     def __init__(self, description: str = "Operation"):
         self.description = description
-        self.start_time = None
-        self.end_time = None
+        self._start_ns = None
+        self._end_ns = None
     
     def __enter__(self):
-        self.start_time = time.time()
+        self._start_ns = time.perf_counter_ns()
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.end_time = time.time()
-        duration = self.end_time - self.start_time
-        logger.info(f"{self.description} completed in {duration:.2f} seconds")
+        self._end_ns = time.perf_counter_ns()
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s completed in %.3f seconds", self.description, self.elapsed)
     
     @property
     def elapsed(self) -> float:
-        if self.start_time is None:
+        if self._start_ns is None:
             return 0.0
         
-        end_time = self.end_time or time.time()
-        return end_time - self.start_time
\ No newline at end of file
+        end_ns = self._end_ns or time.perf_counter_ns()
+        return (end_ns - self._start_ns) / 1e9
\ No newline at end of file
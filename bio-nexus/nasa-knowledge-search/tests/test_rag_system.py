@@ -0,0 +1,87 @@
+"""
+Tests for RAGSystem result handling that does not touch the databases or LLMs
+"""
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("psycopg2")
+pytest.importorskip("neo4j")
+pytest.importorskip("langgraph")
+
+from src.rag_system import RAGSystem
+
+
+@pytest.fixture
+def rag_system():
+    """RAGSystem without its managers; these tests only exercise in-memory helpers"""
+    return RAGSystem.__new__(RAGSystem)
+
+
+def test_extract_sources_cites_each_document_once(rag_system):
+    search_results = {
+        'documents': [
+            {'id': 'doc-1', 'filename': 'bone.pdf', 'title': 'Bone Loss', 'similarity': 0.80},
+            {'id': 'doc-2', 'filename': 'immune.pdf', 'title': 'Immune Response', 'similarity': 0.75},
+        ],
+        'chunks': [
+            {'id': 'chunk-1', 'document_id': 'doc-1', 'filename': 'bone.pdf',
+             'chunk_index': 3, 'similarity': 0.90},
+            {'id': 'chunk-2', 'document_id': 'doc-1', 'filename': 'bone.pdf',
+             'chunk_index': 7, 'similarity': 0.85},
+        ],
+        'knowledge_graph': [],
+    }
+
+    sources = rag_system._extract_sources(search_results)
+
+    assert [(source['type'], source['id']) for source in sources] == [
+        ('chunk', 'chunk-1'),
+        ('document', 'doc-2'),
+    ]
+
+
+def test_extract_sources_ignores_graph_rows(rag_system):
+    search_results = {
+        'documents': [{'id': 'doc-1', 'filename': 'bone.pdf', 'similarity': 0.8}],
+        'chunks': [],
+        'knowledge_graph': [{'source': {'name': 'ISS'}, 'score': 1.0}] * 40,
+    }
+
+    sources = rag_system._extract_sources(search_results)
+
+    assert [source['id'] for source in sources] == ['doc-1']
+
+
+def test_related_topics_skip_neighbours_without_a_name(rag_system):
+    search_results = {
+        'knowledge_graph': [
+            {
+                'source': {'id': 'e1', 'name': 'ISS'},
+                'relationship': {},
+                'target': {'id': 'doc-1', 'name': None, 'title': 'Bone Loss', 'filename': 'bone.pdf'},
+            },
+            {
+                'source': {'id': 'e1', 'name': 'ISS'},
+                'relationship': {},
+                'target': {'id': 'doc-2', 'filename': 'immune.pdf'},
+            },
+        ],
+    }
+
+    assert rag_system.get_related_topics('iss', search_results) == ['ISS']
+
+
+def test_generate_answer_reports_search_errors(rag_system):
+    search_results = {
+        'documents': [],
+        'chunks': [],
+        'knowledge_graph': [],
+        'combined_results': [],
+        'error': 'connection refused',
+    }
+
+    answer = rag_system.generate_answer('bone loss', search_results)
+
+    assert answer['query_type'] == 'error'
+    assert 'connection refused' in answer['answer']